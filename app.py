@@ -1,17 +1,31 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session
 from datetime import datetime
 import json
-from portfolio import Portfolio, Asset
-from etf_search import search_etfs
-from simulation import InvestmentSimulator, plot_portfolio, get_invested_amount, plot_annual_returns, interpret_annual_returns
-from metrics import total_amount_invested, get_portfolio_value, calculate_annual_return_rate, calculate_volatility, calculate_sharpe_ratio, get_metrics_with_interpretations
-from regression import regression, plot_regression
-from comparison import simulate_acwi_equivalent, compare_user_vs_acwi
+from dataclasses import asdict
+from functools import lru_cache
+from importlib.metadata import version
+from etf_search import search_etfs, MAX_RESULTS
+from result_cache import ResultCache, portfolio_key
+
+# pandas, plotly and the simulation modules are imported where they are used,
+# so that a worker starts (and serves the search endpoint) without loading them
 
 # Flask app configuration
 app = Flask(__name__)
 app.secret_key = 'secret_for_session'
 
+# Analysis results shared between requests with the same portfolio parameters
+result_cache = ResultCache(maxsize=128, ttl=900)
+
+# Upper bound of the 'limit' parameter of the ETF search
+SEARCH_LIMIT_MAX = 100
+
+# Search results only change with etfs.csv, so browsers and proxies can keep them for an hour
+SEARCH_MAX_AGE = 3600
+
+# Contribution frequencies known by the simulation
+FREQUENCIES = ['Mensuel', 'Trimestriel', 'Semestriel', 'Annuel']
+
 
 @app.route('/search_etfs')
 def search_etfs_route():
@@ -20,7 +34,42 @@ def search_etfs_route():
     """
 
     q = request.args.get('q', '')
-    return jsonify(search_etfs(q))
+    limit = min(max(request.args.get('limit', MAX_RESULTS, type=int), 1), SEARCH_LIMIT_MAX)
+
+    response = jsonify(search_etfs(q, limit))
+    response.add_etag()
+    response.cache_control.public = True
+    response.cache_control.max_age = SEARCH_MAX_AGE
+    return response.make_conditional(request)
+
+
+@app.route('/plotly.min.js')
+def plotly_js():
+    """
+    Serve the Plotly.js bundle used by every chart, cached by the browser
+    """
+    from plotly.offline import get_plotlyjs
+
+    response = Response(get_plotlyjs(), mimetype='application/javascript')
+    response.set_etag(get_plotly_version())
+    # The URL contains the Plotly version, so the bundle never changes for a given URL
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@lru_cache(maxsize=None)
+def get_plotly_version():
+    """
+    Get the installed Plotly version from the package metadata, without importing plotly
+    """
+    return version("plotly")
+
+
+@app.context_processor
+def inject_plotly_version():
+    return {'plotly_version': get_plotly_version()}
 
 
 def get_form_defaults():
@@ -47,7 +96,8 @@ def create_portfolio_from_session_data(form_data):
     """
     Create a Portfolio object data
     """
-    
+    from portfolio import Portfolio, Asset
+
     assets = [
         Asset(ticker, float(form_data['allocations'][ticker])) 
         for ticker in form_data['tickers']
@@ -84,6 +134,8 @@ def validate_form_data(form):
         raise ValueError("Contribution récurrente invalide.")
     if not (0 <= fee <= 100):
         raise ValueError("Frais hors limites (0-100%).")
+    if form['frequency'] not in FREQUENCIES:
+        raise ValueError("Fréquence invalide.")
 
     # Parse dates
     try:
@@ -105,11 +157,20 @@ def validate_form_data(form):
         allocations = json.loads(form.get('allocations', '{}'))
     except json.JSONDecodeError:
         raise ValueError("Format de portefeuille invalide.")
+    if not isinstance(tickers, list) or not isinstance(allocations, dict):
+        raise ValueError("Format de portefeuille invalide.")
 
     if not tickers:
         raise ValueError("Aucun ETF sélectionné.")
-    
-    total_allocation = sum(float(allocations.get(ticker, 0)) for ticker in tickers)
+
+    # Every selected ETF needs its allocation
+    missing = [ticker for ticker in tickers if ticker not in allocations]
+    if missing:
+        raise ValueError(f"Allocation manquante pour : {', '.join(map(str, missing))}.")
+    try:
+        total_allocation = sum(float(allocations[ticker]) for ticker in tickers)
+    except (ValueError, TypeError):
+        raise ValueError("Allocations invalides.")
     if total_allocation == 0:
         raise ValueError("Aucune allocation définie.")
     if total_allocation > 100:
@@ -127,36 +188,16 @@ def validate_form_data(form):
     }
 
 
-def calculate_portfolio_metrics(portfolio_values, dates, portfolio):
-    """
-    Calculate comprehensive portfolio performance metrics
-    """
-    invested = total_amount_invested(
-        portfolio.initial_amount, 
-        portfolio.recurring_contribution, 
-        dates, 
-        portfolio.contribution_frequency
-    )
-    final_value = get_portfolio_value(portfolio_values)
-    cagr = calculate_annual_return_rate(invested, final_value, dates)
-    volatility = calculate_volatility(portfolio_values)
-    sharpe_ratio = calculate_sharpe_ratio(cagr, volatility)
-
-    return {
-        "Montant investi": f"{invested:,.0f} €",
-        "Valeur finale": f"{final_value:,.0f} €",
-        "CAGR": f"{cagr * 100:.2f} %",
-        "Volatilité annualisée": f"{volatility * 100:.2f} %",
-        "Ratio de Sharpe": f"{sharpe_ratio:.2f}"
-    }
-
-
 def perform_regression_analysis(df, scale='linear'):
     """
     Perform regression analysis on portfolio performance
     """
+    from regression import regression, plot_regression
+
     reg_result = regression(df.index.to_list(), df["Portfolio Value"].values, scale=scale)
-    regression_graph = plot_regression(df, scale=scale)
+
+    # Reuse the fitted trend for the chart
+    regression_graph = plot_regression(df, scale=scale, fit=reg_result['fit'])
     
     regression_analysis = {
         "Facteur de corrélation (R²)": f"{reg_result['r2']:.4f}",
@@ -167,69 +208,213 @@ def perform_regression_analysis(df, scale='linear'):
     
     return regression_graph, regression_analysis
 
-def perform_acwi_comparison(portfolio, user_df):
+def perform_acwi_comparison(portfolio, acwi_prices=None):
     """
-    Compare user portfolio performance with ACWI benchmark
+    Simulate the ACWI benchmark equivalent to the user portfolio
+    Returns the simulated ACWI dataframe and its metrics
     """
+    from comparison import simulate_acwi_equivalent
+    from metrics import compute_metrics
 
     # Simulate equivalent ACWI investment
-    acwi_df = simulate_acwi_equivalent(portfolio)
-    acwi_values = acwi_df["Portfolio Value"].values
-    acwi_dates = acwi_df.index.to_list()
+    acwi_df = simulate_acwi_equivalent(portfolio, acwi_prices)
 
     # Calculate ACWI metrics
-    acwi_invested = total_amount_invested(
-        portfolio.initial_amount, 
-        portfolio.recurring_contribution, 
-        acwi_dates, 
-        portfolio.contribution_frequency
-    )
-    acwi_final = get_portfolio_value(acwi_values)
-    acwi_cagr = calculate_annual_return_rate(acwi_invested, acwi_final, acwi_dates)
-    acwi_volatility = calculate_volatility(acwi_values)
-    acwi_sharpe = calculate_sharpe_ratio(acwi_cagr, acwi_volatility)
-
-    # Calculate user metrics for comparison
-    user_values = user_df["Portfolio Value"].values
-    user_dates = user_df.index.to_list()
-    user_invested = total_amount_invested(
-        portfolio.initial_amount, 
-        portfolio.recurring_contribution, 
-        user_dates, 
-        portfolio.contribution_frequency
+    acwi_metrics = compute_metrics(acwi_df["Portfolio Value"].values, acwi_df.index.to_list(), portfolio)
+
+    return acwi_df, acwi_metrics
+
+
+def run_portfolio_analysis(form_data):
+    """
+    Run the simulation and compute every result that does not depend on chart settings
+    """
+    from market_data import MarketData
+    from simulation import InvestmentSimulator, get_invested_amount, interpret_annual_returns
+    from metrics import compute_metrics
+
+    portfolio = create_portfolio_from_session_data(form_data)
+
+    # Load the prices of the portfolio ETFs and the benchmark at once
+    tickers = [etf.ticker for etf in portfolio.assets]
+    market_data = MarketData(tickers, portfolio.start_date, portfolio.end_date)
+
+    simulator = InvestmentSimulator(portfolio, data=market_data.view(tickers))
+    df = simulator.simulate()
+
+    # Calculate invested amount over time
+    invested_amount = get_invested_amount(
+        dates=df.index.to_list(),
+        initial_amount=portfolio.initial_amount,
+        recurring_contribution=portfolio.recurring_contribution,
+        frequency=portfolio.contribution_frequency
     )
-    user_final = get_portfolio_value(user_values)
-    user_cagr = calculate_annual_return_rate(user_invested, user_final, user_dates)
-    user_volatility = calculate_volatility(user_values)
-    user_sharpe = calculate_sharpe_ratio(user_cagr, user_volatility)
-
-    # Format comparison metrics
-    comparison_metrics = {
-        "Montant investi": {
-            "Vous": f"{user_invested:,.0f} €", 
-            "ACWI": f"{acwi_invested:,.0f} €"
-        },
-        "Valeur finale": {
-            "Vous": f"{user_final:,.0f} €", 
-            "ACWI": f"{acwi_final:,.0f} €"
-        },
-        "CAGR": {
-            "Vous": f"{user_cagr * 100:.2f} %", 
-            "ACWI": f"{acwi_cagr * 100:.2f} %"
-        },
-        "Volatilité annualisée": {
-            "Vous": f"{user_volatility * 100:.2f} %", 
-            "ACWI": f"{acwi_volatility * 100:.2f} %"
-        },
-        "Ratio de Sharpe": {
-            "Vous": f"{user_sharpe:.2f}", 
-            "ACWI": f"{acwi_sharpe:.2f}"
-        }
+
+    # Calculate portfolio performance metrics (formatted only when rendered)
+    metrics = compute_metrics(df["Portfolio Value"].values, df.index.to_list(), portfolio, portfolio.cash_reserve)
+
+    # Compare with ACWI benchmark
+    acwi_df, acwi_metrics = perform_acwi_comparison(portfolio, market_data.view("ACWI"))
+
+    return {
+        'portfolio': portfolio,
+        'portfolio_data': portfolio.print_summary(),
+        'df': df,
+        'invested_amount': invested_amount,
+        'metrics': metrics,
+        'acwi_df': acwi_df,
+        'acwi_metrics': acwi_metrics,
+        'annual_returns_interpretation': interpret_annual_returns(df),
+        'charts': {}  # rendered charts, by (name, scale)
     }
 
-    comparison_graph = compare_user_vs_acwi(user_df, acwi_df)
-    
-    return comparison_metrics, comparison_graph
+
+def get_chart(analysis, name, scale=None):
+    """
+    Get a rendered chart of an analysis, rendering it only once per scale
+    """
+    from simulation import plot_portfolio, plot_annual_returns
+    from comparison import compare_user_vs_acwi
+
+    key = (name, scale)
+    if key not in analysis['charts']:
+        df = analysis['df']
+        if name == 'portfolio':
+            chart = plot_portfolio(df, scale=scale, invested_amount=analysis['invested_amount'])
+        elif name == 'regression':
+            chart = perform_regression_analysis(df, scale)
+        elif name == 'comparison':
+            chart = compare_user_vs_acwi(df, analysis['acwi_df'])
+        elif name == 'annual_returns':
+            chart = plot_annual_returns(df)
+        else:
+            raise ValueError(f"Unknown chart: {name}")
+        analysis['charts'][key] = chart
+
+    return analysis['charts'][key]
+
+
+def to_session_data(validated_data):
+    """
+    Convert validated form data into the format stored in the session
+    """
+    return {
+        **validated_data,
+        'start_date': validated_data['start_date'].strftime('%Y-%m-%d'),
+        'end_date': validated_data['end_date'].strftime('%Y-%m-%d')
+    }
+
+
+def get_cached_analysis(form_data):
+    """
+    Get the analysis of a portfolio from the result cache, running it if needed
+    """
+    cache_key = portfolio_key(form_data)
+    analysis = result_cache.get(cache_key)
+    if analysis is None:
+        analysis = run_portfolio_analysis(form_data)
+        result_cache.set(cache_key, analysis)
+    return cache_key, analysis
+
+
+def get_api_form():
+    """
+    Get the parameters of an API call, from a JSON body or query/form parameters
+    """
+    body = request.get_json(silent=True)
+    if body is None:
+        params = request.values.to_dict()
+    elif not isinstance(body, dict):
+        raise ValueError("Le corps JSON doit être un objet")
+    else:
+        # JSON numbers, lists and objects are passed as the strings the HTML form would send
+        params = {key: value if isinstance(value, str) else json.dumps(value) for key, value in body.items()}
+    return {'fee': '0', **params}
+
+
+def to_epoch_months(dates):
+    """
+    Convert month dates into months since January 1970
+    """
+    return [(date.year - 1970) * 12 + date.month - 1 for date in dates]
+
+
+def to_float_list(values):
+    """
+    Convert values into a JSON list of floats rounded to the cent (null for missing values)
+    """
+    return [None if value != value else round(float(value), 2) for value in values]
+
+
+def api_response(cache_key, payload):
+    """
+    JSON response cacheable by a CDN: results only depend on the parameters
+    """
+    response = jsonify(payload)
+    response.set_etag(cache_key)
+    if request.method == 'GET':
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+
+@app.route('/api/simulate', methods=['GET', 'POST'])
+def api_simulate():
+    """
+    API endpoint returning the simulated portfolio series and its metrics
+    """
+    try:
+        form_data = to_session_data(validate_form_data(get_api_form()))
+    except KeyError as e:
+        return jsonify({'error': f"Paramètre manquant : {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        cache_key, analysis = get_cached_analysis(form_data)
+    except Exception as e:
+        return jsonify({'error': f"Erreur lors de l'analyse du portefeuille: {str(e)}"}), 500
+    df = analysis['df']
+
+    return api_response(cache_key, {
+        'dates': to_epoch_months(df.index),
+        'values': to_float_list(df["Portfolio Value"].values),
+        'invested': to_float_list(analysis['invested_amount']),
+        'metrics': asdict(analysis['metrics'])
+    })
+
+
+@app.route('/api/compare', methods=['GET', 'POST'])
+def api_compare():
+    """
+    API endpoint returning the portfolio and ACWI benchmark series with their metrics
+    """
+    try:
+        form_data = to_session_data(validate_form_data(get_api_form()))
+    except KeyError as e:
+        return jsonify({'error': f"Paramètre manquant : {e.args[0]}"}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        cache_key, analysis = get_cached_analysis(form_data)
+    except Exception as e:
+        return jsonify({'error': f"Erreur lors de l'analyse du portefeuille: {str(e)}"}), 500
+    df = analysis['df']
+    acwi_df = analysis['acwi_df']
+
+    return api_response(cache_key, {
+        'portfolio': {
+            'dates': to_epoch_months(df.index),
+            'values': to_float_list(df["Portfolio Value"].values),
+            'metrics': asdict(analysis['metrics'])
+        },
+        'acwi': {
+            'dates': to_epoch_months(acwi_df.index),
+            'values': to_float_list(acwi_df["Portfolio Value"].values),
+            'metrics': asdict(analysis['acwi_metrics'])
+        }
+    })
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -252,11 +437,7 @@ def index():
         try:
             
             validated_data = validate_form_data(request.form)
-            session['form_data'] = {
-                **validated_data,
-                'start_date': validated_data['start_date'].strftime('%Y-%m-%d'),
-                'end_date': validated_data['end_date'].strftime('%Y-%m-%d')
-            }
+            session['form_data'] = to_session_data(validated_data)
 
             # Redirect to GET to prevent form resubmission
             return redirect(url_for('index'))
@@ -270,59 +451,36 @@ def index():
     form_data = session.get('form_data')
     if form_data:
         try:
-            # Create portfolio and run simulation
-            portfolio = create_portfolio_from_session_data(form_data)
-            simulator = InvestmentSimulator(portfolio)
-            df = simulator.simulate()
-
-            # Calculate invested amount over time
-            invested_amount = get_invested_amount(
-                dates=df.index.to_list(),
-                initial_amount=portfolio.initial_amount,
-                recurring_contribution=portfolio.recurring_contribution,
-                frequency=portfolio.contribution_frequency
-            )
+            from metrics import get_metrics_with_interpretations, format_comparison_metrics
+
+            # Reuse the analysis of the same portfolio parameters if available
+            _, analysis = get_cached_analysis(form_data)
 
             # Get chart scaling preferences
             scale = request.args.get('scale', 'linear')
             reg_scale = request.args.get('reg_scale', 'linear')
 
-            # Generate main portfolio chart
-            graph = plot_portfolio(df, scale=scale, invested_amount=invested_amount)
-
-            # Calculate portfolio performance metrics
-            portfolio_values = df["Portfolio Value"].values
-            dates = df.index.to_list()
-            metrics = get_metrics_with_interpretations(portfolio_values, dates, portfolio)
-
-
-            # Perform regression analysis
-            regression_graph, regression_analysis = perform_regression_analysis(df, reg_scale)
-
-            # Compare with ACWI benchmark
-            comparison_metrics, comparison_graph = perform_acwi_comparison(portfolio, df)
-
-            # Get annual returns chart
-            annual_returns_chart = plot_annual_returns(df)
-            annual_returns_interpretation = interpret_annual_returns(df)
+            # Render charts (only the ones not already rendered for these scales)
+            graph = get_chart(analysis, 'portfolio', scale)
+            regression_graph, regression_analysis = get_chart(analysis, 'regression', reg_scale)
+            comparison_graph = get_chart(analysis, 'comparison')
+            annual_returns_chart = get_chart(analysis, 'annual_returns')
 
             # Update context with analysis results
             context.update({
-                'portfolio': portfolio,
-                'portfolio_data': portfolio.print_summary(),
+                'portfolio': analysis['portfolio'],
+                'portfolio_data': analysis['portfolio_data'],
                 'graph_html': graph,
-                'metrics': metrics,
+                'metrics': get_metrics_with_interpretations(analysis['metrics'], analysis['df'].index.to_list()),
                 'regression_graph': regression_graph,
                 'regression_analysis': regression_analysis,
-                'comparison_metrics': comparison_metrics,
+                'comparison_metrics': format_comparison_metrics(analysis['metrics'], analysis['acwi_metrics']),
                 'comparison_graph': comparison_graph,
                 'scale': scale,
                 'reg_scale': reg_scale, 
-                'annual_returns_chart': annual_returns_chart, 'annual_returns_interpretation': annual_returns_interpretation
+                'annual_returns_chart': annual_returns_chart, 'annual_returns_interpretation': analysis['annual_returns_interpretation']
             })
 
-
-
         except Exception as e:
             context['error'] = f"Erreur lors de l'analyse du portefeuille: {str(e)}"
 
@@ -0,0 +1,101 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from portfolio import Portfolio, Asset
+from simulation import InvestmentSimulator
+
+# Monthly prices shared with the current worker process (set by _init_worker)
+_shared_data = None
+_shared_expense_ratios = None
+_shared_assets = None
+
+
+def build_grid(windows, frequencies, service_fees):
+    """
+    Build the list of scenarios: every combination of window, frequency and service fee
+    """
+    return [
+        {"start_date": pd.Timestamp(start), "end_date": pd.Timestamp(end), "frequency": frequency, "service_fee": fee}
+        for (start, end), frequency, fee in itertools.product(windows, frequencies, service_fees)
+    ]
+
+
+def _init_worker(prices_path, dates, tickers, expense_ratios, assets):
+    """
+    Attach the memory-mapped price matrix once per worker process
+    """
+    global _shared_data, _shared_expense_ratios, _shared_assets
+
+    prices = np.load(prices_path, mmap_mode='r')
+    _shared_data = pd.DataFrame(prices, index=pd.DatetimeIndex(dates), columns=tickers, copy=False)
+    _shared_expense_ratios = expense_ratios
+    _shared_assets = assets
+
+
+def _run_scenario(scenario, initial_amount, recurring_contribution):
+    """
+    Simulate one scenario of the grid on the shared prices
+    """
+    portfolio = Portfolio(
+        assets=[Asset(ticker, weight) for ticker, weight in _shared_assets],
+        initial_amount=initial_amount,
+        recurring_contribution=recurring_contribution,
+        contribution_frequency=scenario["frequency"],
+        start_date=scenario["start_date"],
+        end_date=scenario["end_date"],
+        service_fee=scenario["service_fee"]
+    )
+    simulator = InvestmentSimulator(portfolio, data=_shared_data, expense_ratios=_shared_expense_ratios)
+    return scenario, simulator.simulate()
+
+
+def run_grid(portfolio, windows, frequencies=None, service_fees=None, max_workers=None):
+    """
+    Backtest a portfolio over a grid of (start, end) windows, frequencies and service fees
+    Prices are loaded once and shared with the workers through a memory-mapped file.
+    Yields (scenario, dataframe) pairs as soon as each simulation finishes
+    """
+    if frequencies is None:
+        frequencies = [portfolio.contribution_frequency]
+    if service_fees is None:
+        service_fees = [portfolio.service_fee]
+    scenarios = build_grid(windows, frequencies, service_fees)
+    if not scenarios:
+        return
+
+    # Load the monthly prices once, over the union of all windows
+    full_portfolio = Portfolio(
+        assets=[Asset(etf.ticker, etf.weight * 100) for etf in portfolio.assets],
+        initial_amount=portfolio.initial_amount,
+        recurring_contribution=portfolio.recurring_contribution,
+        contribution_frequency=portfolio.contribution_frequency,
+        start_date=min(scenario["start_date"] for scenario in scenarios),
+        end_date=max(scenario["end_date"] for scenario in scenarios),
+        service_fee=portfolio.service_fee
+    )
+    loader = InvestmentSimulator(full_portfolio)
+    expense_ratios = loader._expense_ratios()
+    assets = [(etf.ticker, etf.weight * 100) for etf in portfolio.assets]
+
+    tmp_dir = tempfile.mkdtemp(prefix="backtest_")
+    try:
+        prices_path = os.path.join(tmp_dir, "prices.npy")
+        np.save(prices_path, loader._price_array())
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(prices_path, loader.dates.values, loader.tickers, expense_ratios, assets)
+        ) as executor:
+            futures = [
+                executor.submit(_run_scenario, scenario, portfolio.initial_amount, portfolio.recurring_contribution)
+                for scenario in scenarios
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
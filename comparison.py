@@ -1,58 +1,72 @@
+import threading
 import pandas as pd
 import numpy as np
-import yfinance as yf
-from simulation import InvestmentSimulator
-from portfolio import Portfolio, Asset
-import plotly.express as px
+from market_data import load_monthly_prices, get_benchmark_prices
+from engine import simulate_prices
+from etf_search import get_etf_info
 import plotly.graph_objects as go
 
+# ACWI expense ratio, looked up once and shared by all requests
+_acwi_expense_ratio = None
+_acwi_lock = threading.Lock()
+
 def get_monthly_prices(ticker, start_date, end_date):
     """
-    This function downloads daily price data  of a ticker and resamples it to monthly frequency
+    This function reads daily price data of a ticker from the local cache and resamples it to monthly frequency
     It uses the last trading day of each month as the monthly price
     """
-    data = yf.download(
-        ticker,
-        start=start_date - pd.DateOffset(months=1),
-        end=end_date,
-        interval="1d",
-        auto_adjust=True
-    )["Close"]
+    return load_monthly_prices([ticker], start_date, end_date)[ticker]
+
 
-    # Resample to monthly frequency using last trading day of each month
-    monthly = data.resample('ME').last()
+def get_acwi_prices(end_date):
+    """
+    Get the process-wide ACWI monthly prices (shared with MarketData) and expense ratio
+    """
+    global _acwi_expense_ratio
 
-    monthly.index = monthly.index + pd.offsets.MonthBegin(1)
-    return monthly
+    acwi_prices = get_benchmark_prices("ACWI", end_date)
+    with _acwi_lock:
+        if _acwi_expense_ratio is None:
+            _acwi_expense_ratio = get_etf_info("ACWI")['fees']
 
+        return acwi_prices, _acwi_expense_ratio
 
-def simulate_acwi_equivalent(portfolio_user):
+
+def simulate_acwi_equivalent(portfolio_user, acwi_prices=None):
     """
-    Create and simulate an ACWI portfolio equivalent to a user's portfolio
+    Simulate an ACWI portfolio equivalent to a user's portfolio
+    acwi_prices are monthly prices already loaded for the request, if any
     """
     
-    # First, get ACWI data to find the first available date
-    acwi_prices = get_monthly_prices("ACWI", portfolio_user.start_date, portfolio_user.end_date)
+    # Get the ACWI prices to find the first available date
+    if acwi_prices is None:
+        acwi_prices, acwi_expense_ratio = get_acwi_prices(portfolio_user.end_date)
+    else:
+        acwi_expense_ratio = get_etf_info("ACWI")['fees']
     acwi_first_date = acwi_prices.first_valid_index()
     
     # Use ACWI first available date or user's start date, whichever is later
     effective_start_date = max(portfolio_user.start_date, acwi_first_date) if acwi_first_date else portfolio_user.start_date
-    
-    # Create ACWI asset with 100% allocation
-    acwi_asset = Asset("ACWI", 100.0)  
+    dates = pd.date_range(start=effective_start_date, end=portfolio_user.end_date, freq='MS')
+
+    # Simulate 100% ACWI with the same contributions and fees
+    freq_map = {"Mensuel": 1, "Trimestriel": 3, "Semestriel": 6, "Annuel": 12}
+    prices = acwi_prices.reindex(dates, method='ffill').to_numpy(dtype=float).reshape(-1, 1)
 
-    acwi_portfolio = Portfolio(
-        assets=[acwi_asset],
+    portfolio_values, _, _ = simulate_prices(
+        prices,
+        [1.0],
         initial_amount=portfolio_user.initial_amount,
         recurring_contribution=portfolio_user.recurring_contribution,
-        contribution_frequency=portfolio_user.contribution_frequency,
-        start_date=effective_start_date,  # Use adjusted start date
-        end_date=portfolio_user.end_date,
-        service_fee=portfolio_user.service_fee
+        months_between=freq_map[portfolio_user.contribution_frequency],
+        service_fee=portfolio_user.service_fee,
+        expense_ratios=[acwi_expense_ratio]
     )
 
-    simulator = InvestmentSimulator(acwi_portfolio)
-    df_acwi = simulator.simulate()
+    df_acwi = pd.DataFrame({
+        "Date": dates,
+        "Portfolio Value": portfolio_values
+    }).set_index("Date")
 
     return df_acwi
 
@@ -94,4 +108,4 @@ def compare_user_vs_acwi(user_df, acwi_df):
         legend_title="Légende"
     )
 
-    return fig.to_html(full_html=False)
\ No newline at end of file
+    return fig.to_html(full_html=False, include_plotlyjs=False)
\ No newline at end of file
@@ -0,0 +1,280 @@
+import numpy as np
+
+
+def availability_mask(prices):
+    """
+    Get a (months x tickers) mask of the ETFs available at each month
+    An ETF is available from its first valid price onwards
+    """
+    valid = ~np.isnan(prices)
+    return np.logical_or.accumulate(valid, axis=0)
+
+
+def dynamic_weights(weights, available):
+    """
+    Get the weights of the available ETFs, rescaled so that they sum to 1
+    """
+    available_weights = np.where(available, weights, 0.0)
+    total = available_weights.sum(axis=-1, keepdims=True)
+    return np.divide(available_weights, total, out=np.zeros_like(available_weights), where=total > 0)
+
+
+def simulate_prices(prices, weights, initial_amount, recurring_contribution, months_between,
+                    service_fee=0.0, expense_ratios=None, units=None, cash=0.0,
+                    rebalance_every=0, rebalance_band=0.0, contribution_rebalance=False, row_months=None):
+    """
+    Simulate passive ETF investing on a (months x tickers) price array, or on daily bars with row_months
+
+    Purchases are made in whole units, the leftover is kept as cash reserve.
+    The portfolio is rebalanced when a new ETF becomes available, and each
+    recurring contribution is invested with the dynamic weights.
+    See simulate_batch for the other rebalancing strategies.
+
+    Returns the portfolio value of each month, the final units and the final cash reserve
+    """
+    values, final_units, final_cash = simulate_batch(
+        prices,
+        np.asarray(weights, dtype=float)[np.newaxis],
+        initial_amounts=initial_amount,
+        recurring_contributions=recurring_contribution,
+        months_between=months_between,
+        service_fees=service_fee,
+        expense_ratios=expense_ratios,
+        units=None if units is None else np.asarray(units, dtype=float)[np.newaxis],
+        cash=cash,
+        rebalance_every=rebalance_every,
+        rebalance_bands=rebalance_band,
+        contribution_rebalance=contribution_rebalance,
+        row_months=row_months
+    )
+    return values[0], final_units[0], float(final_cash[0])
+
+
+def simulate_batch(prices, weights, initial_amounts, recurring_contributions, months_between,
+                   service_fees=0.0, expense_ratios=None, units=None, cash=0.0,
+                   rebalance_every=0, rebalance_bands=0.0, contribution_rebalance=False, row_months=None):
+    """
+    Simulate N portfolios on the same (months x tickers) price array in one pass
+
+    weights is a (N x tickers) matrix. initial_amounts, recurring_contributions,
+    months_between (1, 3, 6 or 12) and service_fees are either scalars or one value per scenario.
+
+    Rebalancing strategies, also scalars or one value per scenario (and combinable):
+    - rebalance_every: sell everything and reinvest with the weights every n months (0 for never)
+    - rebalance_bands: same as soon as the weight of an ETF drifts from its target by more than
+      the band (ex. 0.05 for 5 points, 0 for never)
+    - contribution_rebalance: invest each contribution in the ETFs below their target value
+      first, without selling
+
+    Daily resolution: with row_months, the month number of each row counted from the first month,
+    the rows are daily bars. Contributions and periodic rebalances happen on the first bar of their
+    month, threshold rebalances on any bar. The fees then accrue on every bar instead of being applied
+    once per month: the annual expense ratios in % (like the netExpenseRatio of yfinance) on each holding
+    and the annual service fee in % on the whole portfolio, over 252 bars per year.
+
+    Returns the (N x months) portfolio values, the (N x tickers) final units
+    and the (N,) final cash reserves
+    """
+    prices = np.asarray(prices, dtype=float)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    n_months, n_tickers = prices.shape
+    n_scenarios = weights.shape[0]
+
+    def per_scenario(value, dtype=float):
+        return np.broadcast_to(np.asarray(value, dtype=dtype), (n_scenarios,))
+
+    initial_amounts = per_scenario(initial_amounts)
+    recurring_contributions = per_scenario(recurring_contributions)
+    months_between = per_scenario(months_between, dtype=int)
+    service_fees = per_scenario(service_fees)
+    rebalance_every = per_scenario(rebalance_every, dtype=int)
+    rebalance_bands = per_scenario(rebalance_bands)
+    contribution_rebalance = per_scenario(contribution_rebalance, dtype=bool)
+    if expense_ratios is None:
+        expense_ratios = np.zeros(n_tickers)
+
+    units = np.zeros((n_scenarios, n_tickers)) if units is None else np.array(units, dtype=float)
+    cash = np.array(per_scenario(cash))
+
+    # Precompute availability, and prices with missing values replaced (masked everywhere they are used)
+    available = availability_mask(prices)
+    tradable = available & ~np.isnan(prices)
+    clean_prices = np.where(np.isnan(prices), 0.0, prices)
+    safe_prices = np.where(tradable, prices, 1.0)
+
+    # Month of each row, and the rows starting a month after the initial investment, where contributions
+    # and periodic rebalances happen (every row but the first for monthly prices)
+    daily = row_months is not None
+    month_numbers = np.asarray(row_months, dtype=int) if daily else np.arange(n_months)
+    scheduled = np.zeros(n_months, dtype=bool)
+    scheduled[1:] = (month_numbers[1:] != month_numbers[:-1]) & (month_numbers[1:] >= 1)
+
+    # Months where something happens: new ETFs available or a recurring contribution in any scenario
+    newly_available = np.zeros(n_months, dtype=bool)
+    newly_available[1:] = (available[1:] & ~available[:-1]).any(axis=1)
+    any_contribution = np.zeros(n_months, dtype=bool)
+    for gap in np.unique(months_between):
+        any_contribution |= scheduled & (month_numbers % gap == 0)
+
+    # Schedule of the periodic rebalances, per scenario
+    periodic = (rebalance_every[:, np.newaxis] > 0) & scheduled & (
+        month_numbers % np.maximum(rebalance_every, 1)[:, np.newaxis] == 0)
+
+    # Events known in advance, in order (threshold rebalances are found between them)
+    static_events = np.flatnonzero(newly_available | any_contribution | periodic.any(axis=0))
+    uses_band = rebalance_bands > 0
+
+    expense_ratios = np.asarray(expense_ratios, dtype=float)
+    if daily:
+        # Fees accrued since the first bar: cumulative product of the daily expense ratios per ETF,
+        # and daily service fee rate per scenario (compounded over the bars between two events)
+        decay = np.ones((n_months, n_tickers))
+        decay[1:] = np.cumprod(np.broadcast_to(1 - expense_ratios / 100 / 252, (n_months - 1, n_tickers)), axis=0)
+        holding_prices = clean_prices * decay
+        service_rates = 1 - service_fees / 100 / 252
+        drift_prices = holding_prices
+    else:
+        # Price of each holding, ETF expense ratios applied after the first month
+        holding_prices = clean_prices.copy()
+        holding_prices[1:] *= 1 - expense_ratios / 252
+        drift_prices = clean_prices
+
+    # Initial investment (only in available ETFs)
+    allocation = initial_amounts[:, np.newaxis] * dynamic_weights(weights, available[0])
+    bought = np.where(tradable[0], np.floor(allocation / safe_prices[0]), 0.0)
+    units += bought
+    cash += np.sum(np.where(tradable[0], allocation - bought * clean_prices[0], 0.0), axis=1)
+
+    values = np.empty((n_scenarios, n_months))
+    previous_event = 0
+    next_static = 0
+    breaches = _first_breaches(units, drift_prices, weights, available, rebalance_bands, uses_band,
+                               1, _event_at(static_events, 0, n_months))
+
+    while True:
+        month = min(_event_at(static_events, next_static, n_months), breaches.min())
+        if month >= n_months:
+            break
+        if next_static < len(static_events) and static_events[next_static] == month:
+            next_static += 1
+
+        # Units and cash reserve are constant between two events (except for the accrued fees)
+        if daily:
+            values[:, previous_event:month], units, cash = _accrue(
+                units, cash, holding_prices, decay, service_rates, previous_event, month)
+        else:
+            values[:, previous_event:month] = units @ holding_prices[previous_event:month].T + cash[:, np.newaxis]
+        previous_event = month
+
+        price = clean_prices[month]
+        can_buy = tradable[month]
+        weights_now = dynamic_weights(weights, available[month])
+
+        # Sell everything and reinvest with the weights: for every scenario when new ETFs
+        # became available, otherwise in the scenarios with a periodic or threshold rebalance
+        rebalances = newly_available[month] | periodic[:, month] | (breaches == month)
+        if rebalances.any():
+            held = (units > 0) & rebalances[:, np.newaxis]
+            holdings_value = np.sum(np.where(held, units * prices[month], 0.0), axis=1)
+            total_value = holdings_value + cash
+            cash = np.where(rebalances, total_value, cash)
+            units = np.where(rebalances[:, np.newaxis], 0.0, units)
+
+            allocation = total_value[:, np.newaxis] * weights_now
+            bought = np.where(can_buy & rebalances[:, np.newaxis], np.floor(allocation / safe_prices[month]), 0.0)
+            units += bought
+            cash -= np.sum(bought * price, axis=1)
+
+        contributes = scheduled[month] & (month_numbers[month] % months_between == 0)
+        if contributes.any():
+            cash += np.where(contributes, recurring_contributions, 0.0)
+
+            # Contribution rebalancing: the cash goes to the ETFs below their target value first,
+            # in proportion to their shortfall, and what is left with the weights
+            toward_targets = contributes & contribution_rebalance
+            if toward_targets.any():
+                holdings = units * price
+                targets = (holdings.sum(axis=1) + cash)[:, np.newaxis] * weights_now
+                shortfalls = np.where(can_buy, np.maximum(targets - holdings, 0.0), 0.0)
+                total_shortfall = shortfalls.sum(axis=1)
+                spent = np.minimum(cash, total_shortfall)
+                allocation = (
+                    np.divide(shortfalls * spent[:, np.newaxis], total_shortfall[:, np.newaxis],
+                              out=np.zeros_like(shortfalls), where=total_shortfall[:, np.newaxis] > 0)
+                    + (cash - spent)[:, np.newaxis] * weights_now
+                )
+                bought = np.where(can_buy & toward_targets[:, np.newaxis], np.floor(allocation / safe_prices[month]), 0.0)
+                units += bought
+                cash -= np.sum(bought * price, axis=1)
+
+            # Recurring contribution: each ETF takes its weight of the remaining cash, in order
+            by_weights = contributes & ~contribution_rebalance
+            for ticker in np.flatnonzero(can_buy):
+                bought = np.where(by_weights, np.floor(weights_now[:, ticker] * cash / price[ticker]), 0.0)
+                units[:, ticker] += bought
+                cash -= bought * price[ticker]
+
+        # Holdings changed: look for the next threshold breaches, up to the next event known in advance
+        breaches = _first_breaches(units / decay[month] if daily else units, drift_prices, weights, available,
+                                   rebalance_bands, uses_band, month + 1,
+                                   _event_at(static_events, next_static, n_months))
+
+    if daily:
+        values[:, previous_event:], units, cash = _accrue(
+            units, cash, holding_prices, decay, service_rates, previous_event, n_months)
+    else:
+        values[:, previous_event:] = units @ holding_prices[previous_event:].T + cash[:, np.newaxis]
+
+        # Service fee applied only after the first month
+        values[:, 1:] *= (1 - service_fees / 100 / 12)[:, np.newaxis]
+
+    return values, units, cash
+
+
+def _event_at(events, position, n_months):
+    """
+    Get the month of an event of the schedule, or n_months after the last one
+    """
+    return events[position] if position < len(events) else n_months
+
+
+def _accrue(units, cash, holding_prices, decay, service_rates, start, stop):
+    """
+    Get the values of the bars [start, stop) with the holdings of bar start, the fees accruing on
+    every bar, and the holdings (units and cash reserve) left at bar stop (or the last bar)
+    decay is the cumulative product of the daily expense ratios, already applied to holding_prices
+    """
+    # Units as of the first bar, so that the expense ratios accrued since start are those of holding_prices
+    base_units = units / decay[start]
+    service = service_rates[:, np.newaxis] ** np.arange(stop - start)
+    values = (base_units @ holding_prices[start:stop].T + cash[:, np.newaxis]) * service
+
+    # The fees are taken from the holdings themselves (fractions of units and of the cash reserve)
+    end = min(stop, len(decay) - 1)
+    service_at_end = service_rates ** (end - start)
+    return values, base_units * decay[end] * service_at_end[:, np.newaxis], cash * service_at_end
+
+
+def _first_breaches(units, prices, weights, available, bands, uses_band, start, stop):
+    """
+    Get the first month of [start, stop] where the weight of an ETF drifts from its target
+    by more than the band, per scenario (n_months if none)
+    Holdings are constant until stop, so the drift of all those months is computed at once
+    """
+    n_months = len(prices)
+    breaches = np.full(len(units), n_months)
+    stop = min(stop, n_months - 1)
+    if not uses_band.any() or start > stop:
+        return breaches
+
+    # Targets only change when an ETF becomes available, which is an event known in advance
+    targets = dynamic_weights(weights[uses_band], available[start])[:, np.newaxis, :]
+
+    # (scenarios x months x tickers) holding values and weights
+    holdings = units[uses_band][:, np.newaxis, :] * prices[np.newaxis, start:stop + 1]
+    totals = holdings.sum(axis=2, keepdims=True)
+    drift = np.abs(np.divide(holdings, totals, out=np.zeros_like(holdings), where=totals > 0) - targets)
+    breached = (drift.max(axis=2) > bands[uses_band][:, np.newaxis]) & (totals[:, :, 0] > 0)
+
+    breaches[uses_band] = np.where(breached.any(axis=1), start + breached.argmax(axis=1), n_months)
+    return breaches
@@ -1,5 +1,6 @@
 import csv
-import yfinance as yf
+import re
+from bisect import bisect_left
 
 def load_etfs(csv_path='etfs.csv'):
     """
@@ -20,23 +21,127 @@ def load_etfs(csv_path='etfs.csv'):
     return etfs
 
 
-# Load ETFs once at module import time for better performance
-ETFS = load_etfs()
+# Maximum number of ETFs returned by a search
+MAX_RESULTS = 20
 
 
-def search_etfs(query):
+def trigrams(text):
     """
-    Search for ETFs whose symbols start with the input
+    Get the trigrams of the words of a text, lowercased and padded with spaces
+    Ex. "World" gives " wo", "wor", "orl", "rld", "ld "
     """
-    query = query.upper()
+    words = re.sub(r'[^a-z0-9]+', ' ', text.lower()).split()
+    return {f" {word} "[i:i + 3] for word in words for i in range(len(word))}
+
+
+class ETFIndex:
+    """
+    ETFs sorted by symbol, with the sorted symbols (prefix searches with bisect), a symbol -> name dict,
+    and a trigram inverted index over symbols and names (trigram -> positions of the ETFs)
+    """
+
+    # Minimum share of the query trigrams an ETF must contain to be a fuzzy match
+    MIN_MATCH = 0.5
+
+    def __init__(self, etfs):
+        import numpy as np
+
+        self.etfs = sorted(etfs, key=lambda etf: etf['symbol'])
+        self.symbols = [etf['symbol'] for etf in self.etfs]
+        self.names = {}
+        for etf in etfs:
+            # Keep the first name of a duplicated symbol
+            self.names.setdefault(etf['symbol'], etf['name'])
+
+        postings = {}
+        for position, etf in enumerate(self.etfs):
+            for trigram in trigrams(f"{etf['symbol']} {etf['name']}"):
+                postings.setdefault(trigram, []).append(position)
+        self.postings = {trigram: np.array(positions, dtype=np.int32) for trigram, positions in postings.items()}
+
+        # Tie-breaker subtracted from the fuzzy scores: shorter names first, then by symbol
+        # (unique values, also much faster to partition than many equal scores)
+        order = np.lexsort((np.arange(len(self.etfs)), [len(etf['name']) for etf in self.etfs]))
+        self.tie_breaker = np.empty(len(self.etfs))
+        self.tie_breaker[order] = np.arange(len(self.etfs)) / max(len(self.etfs), 1) * 1e-6
+
+    def prefix_range(self, prefix):
+        """
+        Get the range of positions of the ETFs whose symbols start with the prefix
+        """
+        # Symbols starting with the prefix are contiguous, from the prefix to the next prefix
+        # (ex. "VT" to "VU" excluded)
+        start = bisect_left(self.symbols, prefix)
+        end = bisect_left(self.symbols, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        return start, end
+
+    def fuzzy_positions(self, query, limit):
+        """
+        Get the positions of the ETFs sharing the most trigrams with the query, best first
+        Rare trigrams weigh more, and shorter names come first on equal scores
+        """
+        import numpy as np
+
+        query_trigrams = trigrams(query)
+        lists = [self.postings[trigram] for trigram in query_trigrams if trigram in self.postings]
+        if not lists:
+            return []
+
+        # Count the matched trigrams of every ETF at once, and their inverse document frequency
+        positions = np.concatenate(lists)
+        weights = np.repeat([np.log(1 + len(self.etfs) / len(p)) for p in lists], [len(p) for p in lists])
+        counts = np.bincount(positions, minlength=len(self.etfs))
+        scores = np.bincount(positions, weights=weights, minlength=len(self.etfs))
+
+        candidates = np.flatnonzero(counts >= self.MIN_MATCH * len(query_trigrams))
+        keys = scores[candidates] - self.tie_breaker[candidates]
+        if len(candidates) > limit:
+            best = np.argpartition(-keys, limit)[:limit]
+            candidates, keys = candidates[best], keys[best]
+
+        return candidates[np.argsort(-keys)].tolist()
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Get the ETFs matching the query: symbols starting with it first (by symbol),
+        then the best fuzzy matches on symbols and names
+        """
+        start, end = self.prefix_range(query.upper())
+        positions = list(range(start, min(end, start + limit)))
+
+        if len(positions) < limit:
+            # Every symbol match is already in the results
+            fuzzy = [p for p in self.fuzzy_positions(query, limit + end - start) if not start <= p < end]
+            positions += fuzzy[:limit - len(positions)]
+
+        return [self.etfs[p] for p in positions]
+
+
+_index = None
+
+
+def get_index():
+    """
+    Get the ETF index, built once on first use (not at import, to keep worker startup fast)
+    """
+    global _index
+
+    if _index is None:
+        _index = ETFIndex(load_etfs())
+
+    return _index
+
+
+def search_etfs(query, limit=MAX_RESULTS):
+    """
+    Search for ETFs by symbol or name (at most limit results)
+    """
+    query = query.strip()
     
     if len(query) < 1: # minimum 1 character
         return []
     
-    # Filter ETFs where symbol starts with the input
-    results = [etf for etf in ETFS if etf['symbol'].startswith(query)]
-    
-    return results
+    return get_index().search(query, limit)
 
 
 def get_etf_name(symbol):
@@ -45,16 +150,15 @@ def get_etf_name(symbol):
     """
 
     symbol = symbol.upper()
-    for etf in ETFS:
-        if etf['symbol'] == symbol:
-            return etf['name']
-        
-    return symbol 
+    return get_index().names.get(symbol, symbol)
 
 
 def get_etf_info(ticker_symbol):
-    try:
-        info = yf.Ticker(ticker_symbol).info
-        return {'fees': info.get('netExpenseRatio', 0.0), 'ticker': ticker_symbol}
-    except:
-        return {'fees': 0.0, 'ticker': ticker_symbol}
\ No newline at end of file
+    """
+    Get the expense ratio of an ETF from the cached expense ratio store
+    'error' is set when the lookup failed and the fees default to 0%
+    """
+    from expense_ratios import get_expense_ratio
+
+    fees, error = get_expense_ratio(ticker_symbol)
+    return {'fees': fees, 'ticker': ticker_symbol, 'error': error}
\ No newline at end of file
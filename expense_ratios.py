@@ -0,0 +1,148 @@
+import csv
+import json
+import os
+import threading
+import time
+from price_cache import atomic_write
+from providers import get_provider
+
+# Directory of the looked up expense ratios, one file per provider (symbol -> fees, lookup time, error)
+STORE_DIR = os.environ.get(
+    "EXPENSE_RATIO_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "expense_ratios")
+)
+
+# Expense ratios rarely change: keep them 30 days, retry failed lookups after 1 day
+TTL = 30 * 24 * 3600
+FAILURE_TTL = 24 * 3600
+
+
+def load_seed_expense_ratios(csv_path='etfs.csv'):
+    """
+    Load the expense ratios given in the optional 'expense_ratio' column of the ETF CSV file
+    """
+    seeds = {}
+    try:
+        with open(csv_path, newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                value = (row.get('expense_ratio') or '').strip()
+                if value:
+                    seeds[row['symbol'].upper()] = float(value)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"Error loading expense ratios from '{csv_path}': {e}")
+
+    return seeds
+
+
+class ExpenseRatioStore:
+    def __init__(self, provider=None, path=None, seeds=None):
+        self.provider = provider if provider is not None else get_provider()
+        self.path = path if path is not None else os.path.join(STORE_DIR, f"{self.provider.name}.json")
+        self.seeds = seeds if seeds is not None else load_seed_expense_ratios()
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _fresh(self, symbol):
+        """
+        Get the stored entry of a symbol if it has not expired (None otherwise)
+        """
+        entry = self._load().get(symbol)
+        if entry is not None:
+            ttl = TTL if entry['error'] is None else FAILURE_TTL
+            if time.time() - entry['fetched_at'] < ttl:
+                return entry
+        return None
+
+    def _save(self, entries):
+        """
+        Add entries to the file, reloaded first so that the entries written meanwhile
+        by other workers (or by the nightly refresh) are kept
+        """
+        self._entries = self._read()
+        self._entries.update(entries)
+        content = json.dumps(self._entries, indent=1, sort_keys=True).encode('utf-8')
+        atomic_write(self.path, lambda f: f.write(content))
+
+    def get(self, symbol):
+        """
+        Get the expense ratio of a symbol and the error of its last lookup (None if it succeeded)
+        The provider is only called when the symbol is not seeded and its cached entry expired
+        """
+        symbol = symbol.upper()
+        if symbol in self.seeds:
+            return self.seeds[symbol], None
+
+        with self._lock:
+            entry = self._fresh(symbol)
+            if entry is None:
+                # Another worker may have looked it up since the file was loaded
+                self._entries = self._read()
+                entry = self._fresh(symbol)
+        if entry is not None:
+            return entry['fees'], entry['error']
+
+        # Network call outside of the lock, so that it does not block the other lookups
+        entry = _lookup(self.provider, symbol)
+        with self._lock:
+            self._save({symbol: entry})
+
+        if entry['error'] is not None:
+            print(f"Warning: no expense ratio for {symbol} ({entry['error']}), using 0%")
+        return entry['fees'], entry['error']
+
+    def refresh(self, symbols):
+        """
+        Look up the expense ratios of many symbols at once (ex. from a nightly job)
+        """
+        entries = {
+            symbol.upper(): _lookup(self.provider, symbol.upper())
+            for symbol in symbols if symbol.upper() not in self.seeds
+        }
+        with self._lock:
+            self._save(entries)
+
+
+def _lookup(provider, symbol):
+    """
+    Look up the net expense ratio from the provider, recording the failure if there is one
+    """
+    try:
+        fees = provider.expense_ratio(symbol)
+        error = None if fees is not None else "netExpenseRatio not available"
+    except Exception as e:
+        fees, error = None, f"{type(e).__name__}: {e}"
+
+    return {'fees': fees if fees is not None else 0.0, 'fetched_at': time.time(), 'error': error}
+
+
+# Shared store for the application
+_store = ExpenseRatioStore()
+
+
+def get_expense_ratio(symbol):
+    """
+    Get the expense ratio of a symbol and the error of its lookup (None if it succeeded)
+    """
+    return _store.get(symbol)
+
+
+if __name__ == '__main__':
+    from etf_search import load_etfs
+    symbols = [etf['symbol'] for etf in load_etfs()] + ["ACWI"]
+    _store.refresh(symbols)
+    failed = [symbol for symbol, entry in _store._entries.items() if entry['error'] is not None]
+    print(f"Expense ratios refreshed for {len(symbols)} symbols, {len(failed)} failed: {', '.join(failed)}")
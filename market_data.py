@@ -0,0 +1,86 @@
+import threading
+import pandas as pd
+from price_cache import REFRESH_START, get_daily_prices, get_monthly_prices, get_price_cache
+from price_matrix import get_price_matrix
+
+# Benchmarks needed by every portfolio analysis
+BENCHMARKS = ["ACWI"]
+
+# Benchmark monthly prices over the whole refresh period, loaded once and shared by all requests
+# (by symbol: prices and the stamp of the stored prices they were loaded from)
+_benchmark_prices = {}
+_benchmark_lock = threading.Lock()
+
+
+def load_monthly_prices(symbols, start_date, end_date):
+    """
+    Loads historical closing prices, per month.
+    For a month, the price is of the last day of last's month.
+    Ex. for may 2024, we have the closing price of april 30th, 2024.
+    """
+
+    # Slice the shared month-start matrix when it has every month
+    matrix = get_price_matrix()
+    if matrix is not None and matrix.covers(symbols, start_date, end_date):
+        return matrix.window(symbols, start_date, end_date)
+
+    # Otherwise slice the monthly series stored with the daily prices (resampled when ingested)
+    return get_monthly_prices(symbols, start_date, end_date)
+
+
+def load_daily_prices(symbols, start_date, end_date):
+    """
+    Loads historical daily closing prices, from the first day of the month of start_date to end_date.
+    A missing close (ex. a holiday of one exchange only) is the previous close of the ETF.
+    """
+    start = pd.Timestamp(start_date).to_period("M").to_timestamp()
+    daily_data = get_daily_prices(symbols, start, pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    return daily_data.ffill()
+
+
+def get_benchmark_prices(symbol, end_date):
+    """
+    Get the process-wide monthly prices of a benchmark, from the refresh start to today
+    They are loaded once, and reloaded when a later end date is requested or when the stored
+    prices changed (rewritten in the cache, ex. adjusted again, or a rebuilt price matrix)
+    """
+    with _benchmark_lock:
+        prices, stamp = _benchmark_prices.get(symbol, (None, None))
+        if prices is None or prices.index[-1] < pd.Timestamp(end_date) or stamp != _stored_stamp(symbol):
+            prices = load_monthly_prices(
+                [symbol],
+                pd.Timestamp(REFRESH_START) + pd.DateOffset(months=1),
+                pd.Timestamp.today().normalize()
+            )[symbol]
+            # Stamp taken after loading, which may have updated the cache
+            _benchmark_prices[symbol] = (prices, _stored_stamp(symbol))
+        return prices
+
+
+def _stored_stamp(symbol):
+    """
+    Get a stamp of the stored prices of a symbol, which changes when they are rewritten
+    """
+    matrix = get_price_matrix()
+    return get_price_cache().stamp(symbol), None if matrix is None else matrix.mtime
+
+
+class MarketData:
+    """
+    Monthly prices of every symbol needed by a request (portfolio tickers and benchmarks),
+    the tickers loaded with one batch of cache reads, the benchmarks taken from the shared series
+    """
+
+    def __init__(self, tickers, start_date, end_date, benchmarks=BENCHMARKS):
+        self.symbols = list(dict.fromkeys([*tickers, *benchmarks]))
+        tickers = list(dict.fromkeys(tickers))
+        self.monthly = load_monthly_prices(tickers, start_date, end_date)
+
+        for benchmark in self.symbols[len(tickers):]:
+            self.monthly[benchmark] = get_benchmark_prices(benchmark, end_date).reindex(self.monthly.index)
+
+    def view(self, symbols):
+        """
+        Get the monthly prices of some symbols (a DataFrame for a list, a Series for one symbol)
+        """
+        return self.monthly[symbols]
@@ -1,20 +1,20 @@
-import pandas as pd
+from dataclasses import dataclass
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+# Maps the frequency to the number of months between contributions
+FREQUENCY_MONTHS = {
+    "Mensuel": 1,
+    "Trimestriel": 3,
+    "Semestriel": 6,
+    "Annuel": 12
+}
+
 
 def total_amount_invested(initial_amount, recurring_contribution, dates, frequency):
     """
     Calculates how much money was invested over time in total
     """
-    # Maps the frequency to the number of months between contributions
-    frequency_to_months = {
-        "Mensuel": 1,      
-        "Trimestriel": 3,   
-        "Semestriel": 6,   
-        "Annuel": 12       
-    }
-    
-    months_gap = frequency_to_months[frequency]
+    months_gap = FREQUENCY_MONTHS[frequency]
     
     # Get the number of contributions made
     contribution_count = 0
@@ -57,29 +57,21 @@ def calculate_annual_return_rate(amount_invested, final_portfolio_value, date_li
     return cagr
 
 
+def contribution_flows(dates, recurring_contribution, frequency):
+    """
+    Get the contribution added at each date (none at the first one, which is the initial amount)
+    """
+    flows = np.zeros(len(dates))
+    months_gap = FREQUENCY_MONTHS[frequency]
+    flows[months_gap::months_gap] = recurring_contribution
+    return flows
+
+
 def calculate_volatility(portfolio_values):
     """
     Calculate the standard volatility of returns
     """
-
-    values_series = pd.Series(portfolio_values)
-    
-    # Calculate percentage change between consecutive values
-    # pct_change() gives us the returns for each period
-    returns = values_series.pct_change()
-    
-    # Remove NaN values (the first return will be NaN)
-    clean_returns = returns.dropna()
-    
-    # If we have no returns, volatility is 0
-    if clean_returns.empty:
-        return 0
-    
-    # Multiply by sqrt(12) to convert monthly volatility to annual
-    monthly_std = clean_returns.std()
-    annual_volatility = monthly_std * np.sqrt(12)
-    
-    return annual_volatility
+    return float(series_metrics(portfolio_values).volatility)
 
 def calculate_sharpe_ratio(annual_return, volatility, risk_free_rate=0.02):
     """
@@ -94,9 +86,110 @@ def calculate_sharpe_ratio(annual_return, volatility, risk_free_rate=0.02):
     sharpe = (annual_return - risk_free_rate) / volatility
     return sharpe
 
-def calculate_portfolio_metrics(portfolio_values, dates, portfolio):
+@dataclass
+class SeriesMetrics:
+    """
+    Risk and return metrics of value series (see series_metrics)
+    Each field is a number for one series, or an array with one value per series for N series.
+    Rates are proportions, ex. -0.25 for a 25 % drawdown
+    """
+    twr: object                     # annualized time-weighted return
+    volatility: object              # annualized volatility of the returns
+    max_drawdown: object            # largest fall from a previous peak (0 or negative)
+    drawdown_duration: object       # longest number of periods below a previous peak
+    sortino_ratio: object
+    calmar_ratio: object
+    rolling_volatility: np.ndarray  # annualized volatility of the last `window` returns at each period (NaN before)
+
+
+def series_metrics(values, flows=None, periods_per_year=12, window=12, risk_free_rate=0.02):
     """
-    Get all metrics
+    Compute the risk and return metrics of value series in O(periods), on numpy arrays only
+    values is one series of portfolio values, or a (N x periods) matrix (ex. the output of simulate_batch).
+    flows is the money added at each period (the contributions, for one or every series):
+    it is taken out of the returns, so that the metrics measure the investments only
+    """
+    values = np.asarray(values, dtype=float)
+    n_periods = values.shape[-1]
+    flows = np.broadcast_to(np.zeros(n_periods) if flows is None else np.asarray(flows, dtype=float), values.shape)
+
+    # Returns net of the flows (0 while nothing is invested)
+    previous = values[..., :-1]
+    returns = np.divide(values[..., 1:] - flows[..., 1:], previous, out=np.ones_like(previous), where=previous > 0) - 1
+    n_returns = n_periods - 1
+
+    # Growth of 1 invested at the start (time-weighted), and its falls from the previous peak
+    growth = np.cumprod(1 + returns, axis=-1)
+    peaks = np.maximum(np.maximum.accumulate(growth, axis=-1), 1.0)
+    drawdowns = growth / peaks - 1
+    max_drawdown = drawdowns.min(axis=-1, initial=0.0)
+
+    # Periods since the last peak, at each period
+    periods = np.arange(1, n_periods)
+    last_peaks = np.maximum.accumulate(np.where(drawdowns >= 0, periods, 0), axis=-1)
+    drawdown_duration = (periods - last_peaks).max(axis=-1, initial=0)
+
+    years = n_returns / periods_per_year
+    final_growth = growth[..., -1] if n_returns > 0 else np.ones(values.shape[:-1])
+    twr = final_growth ** (1 / years) - 1 if years > 0 else np.zeros(values.shape[:-1])
+
+    # Sample volatility, and downside deviation (losses only)
+    if n_returns > 1:
+        volatility = returns.std(axis=-1, ddof=1) * np.sqrt(periods_per_year)
+    else:
+        volatility = np.zeros(values.shape[:-1])
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2, axis=-1) if n_returns > 0 else 0) * np.sqrt(periods_per_year)
+
+    # Ratios are 0 when there is no risk (like the Sharpe ratio)
+    sortino_ratio = np.divide(twr - risk_free_rate, downside, out=np.zeros_like(twr), where=downside > 0)
+    calmar_ratio = np.divide(twr, -max_drawdown, out=np.zeros_like(twr), where=max_drawdown < 0)
+
+    # Rolling volatility from the cumulative sums of returns and squared returns
+    rolling_volatility = np.full(values.shape, np.nan)
+    if n_returns >= window > 1:
+        padding = np.zeros(values.shape[:-1] + (1,))
+        sums = np.concatenate([padding, np.cumsum(returns, axis=-1)], axis=-1)
+        square_sums = np.concatenate([padding, np.cumsum(returns ** 2, axis=-1)], axis=-1)
+        window_sums = sums[..., window:] - sums[..., :-window]
+        variance = (square_sums[..., window:] - square_sums[..., :-window] - window_sums ** 2 / window) / (window - 1)
+        rolling_volatility[..., window:] = np.sqrt(np.maximum(variance, 0)) * np.sqrt(periods_per_year)
+
+    def scalar(array):
+        return array.item() if np.ndim(array) == 0 else array
+
+    return SeriesMetrics(
+        twr=scalar(twr),
+        volatility=scalar(volatility),
+        max_drawdown=scalar(max_drawdown),
+        drawdown_duration=scalar(drawdown_duration),
+        sortino_ratio=scalar(sortino_ratio),
+        calmar_ratio=scalar(calmar_ratio),
+        rolling_volatility=rolling_volatility
+    )
+
+
+@dataclass
+class MetricsResult:
+    """
+    Main metrics of a portfolio value series, as raw numbers
+    Rates (cagr, volatility) are proportions, ex. 0.05 for 5 %
+    """
+    invested: float
+    final_value: float
+    cagr: float
+    volatility: float
+    sharpe_ratio: float
+    cash_reserve: float = 0.0
+    twr: float = 0.0                # annualized time-weighted return
+    max_drawdown: float = 0.0       # 0 or negative
+    drawdown_months: int = 0
+    sortino_ratio: float = 0.0
+    calmar_ratio: float = 0.0
+
+
+def compute_metrics(portfolio_values, dates, portfolio, cash_reserve=0.0):
+    """
+    Compute all metrics of a series once, to be shared by every display
     """
     invested = total_amount_invested(
         portfolio.initial_amount,
@@ -106,16 +199,95 @@ def calculate_portfolio_metrics(portfolio_values, dates, portfolio):
     )
     final_value = get_portfolio_value(portfolio_values)
     cagr = calculate_annual_return_rate(invested, final_value, dates)
+
     volatility = calculate_volatility(portfolio_values)
     sharpe_ratio = calculate_sharpe_ratio(cagr, volatility)
 
+    # Time-weighted and drawdown metrics in one pass, the contributions taken out of the returns
+    flows = contribution_flows(dates, portfolio.recurring_contribution, portfolio.contribution_frequency)
+    series = series_metrics(portfolio_values, flows)
+
+    return MetricsResult(
+        invested=float(invested),
+        final_value=float(final_value),
+        cagr=float(cagr),
+        volatility=float(volatility),
+        sharpe_ratio=float(sharpe_ratio),
+        cash_reserve=float(cash_reserve),
+        twr=float(series.twr),
+        max_drawdown=float(series.max_drawdown),
+        drawdown_months=int(series.drawdown_duration),
+        sortino_ratio=float(series.sortino_ratio),
+        calmar_ratio=float(series.calmar_ratio)
+    )
+
+
+def format_metrics(result):
+    """
+    Format metrics for display
+    """
+    return {
+        "Montant investi": f"{result.invested:,.0f} €",
+        "Valeur du portefeuille": f"{result.final_value:,.0f} €",
+        "Cash non investi": f"{result.cash_reserve:,.0f} €",
+        "CAGR": f"{result.cagr * 100:.2f} %",
+        "Volatilité annualisée": f"{result.volatility * 100:.2f} %",
+        "Ratio de Sharpe": f"{result.sharpe_ratio:.2f}",
+        "Rendement pondéré (TWR)": f"{result.twr * 100:.2f} %",
+        "Baisse maximale": f"{result.max_drawdown * 100:.2f} % ({result.drawdown_months} mois)",
+        "Ratio de Sortino": f"{result.sortino_ratio:.2f}",
+        "Ratio de Calmar": f"{result.calmar_ratio:.2f}"
+    }
+
+
+def calculate_portfolio_metrics(portfolio_values, dates, portfolio):
+    """
+    Get all metrics, formatted
+    """
+    return format_metrics(compute_metrics(portfolio_values, dates, portfolio, portfolio.cash_reserve))
+
+
+def format_comparison_metrics(user_result, acwi_result):
+    """
+    Format the metrics of the user portfolio and of the ACWI benchmark side by side
+    """
     return {
-        "Montant investi": f"{invested:,.0f} €",
-        "Valeur du portefeuille": f"{final_value:,.0f} €",
-        "Cash non investi": f"{portfolio.cash_reserve:,.0f} €",
-        "CAGR": f"{cagr * 100:.2f} %",
-        "Volatilité annualisée": f"{volatility * 100:.2f} %",
-        "Ratio de Sharpe": f"{sharpe_ratio:.2f}"
+        "Montant investi": {
+            "Vous": f"{user_result.invested:,.0f} €", 
+            "ACWI": f"{acwi_result.invested:,.0f} €"
+        },
+        "Valeur finale": {
+            "Vous": f"{user_result.final_value:,.0f} €", 
+            "ACWI": f"{acwi_result.final_value:,.0f} €"
+        },
+        "CAGR": {
+            "Vous": f"{user_result.cagr * 100:.2f} %", 
+            "ACWI": f"{acwi_result.cagr * 100:.2f} %"
+        },
+        "Volatilité annualisée": {
+            "Vous": f"{user_result.volatility * 100:.2f} %", 
+            "ACWI": f"{acwi_result.volatility * 100:.2f} %"
+        },
+        "Ratio de Sharpe": {
+            "Vous": f"{user_result.sharpe_ratio:.2f}", 
+            "ACWI": f"{acwi_result.sharpe_ratio:.2f}"
+        },
+        "Rendement pondéré (TWR)": {
+            "Vous": f"{user_result.twr * 100:.2f} %",
+            "ACWI": f"{acwi_result.twr * 100:.2f} %"
+        },
+        "Baisse maximale": {
+            "Vous": f"{user_result.max_drawdown * 100:.2f} %",
+            "ACWI": f"{acwi_result.max_drawdown * 100:.2f} %"
+        },
+        "Ratio de Sortino": {
+            "Vous": f"{user_result.sortino_ratio:.2f}",
+            "ACWI": f"{acwi_result.sortino_ratio:.2f}"
+        },
+        "Ratio de Calmar": {
+            "Vous": f"{user_result.calmar_ratio:.2f}",
+            "ACWI": f"{acwi_result.calmar_ratio:.2f}"
+        }
     }
 
 
@@ -175,6 +347,61 @@ def interpret_sharpe_ratio(sharpe_ratio):
         return "Ratio exceptionnel. Performance ajustée au risque excellente."
 
 
+def interpret_time_weighted_return(twr_percentage, cagr_percentage):
+    """
+    Interprets the time-weighted return, compared with the CAGR on the invested amount
+    """
+    if twr_percentage > cagr_percentage + 1:
+        return "Rendement des placements supérieur au CAGR : les versements récents ont eu peu de temps pour fructifier."
+    elif twr_percentage < cagr_percentage - 1:
+        return "Rendement des placements inférieur au CAGR : les versements ont profité de bonnes périodes de marché."
+    else:
+        return "Rendement des placements proche du CAGR : le calendrier des versements a peu d'effet."
+
+
+def interpret_max_drawdown(drawdown_percentage, drawdown_months):
+    """
+    Interprets the largest fall from a previous peak, and the longest time spent below a peak
+    """
+    duration = f" Plus longue période sous un précédent sommet : {drawdown_months} mois."
+    if drawdown_percentage > -10:
+        return "Baisse maximale limitée. Le portefeuille a bien résisté aux replis du marché." + duration
+    elif drawdown_percentage > -20:
+        return "Baisse maximale modérée, habituelle pour un portefeuille diversifié." + duration
+    elif drawdown_percentage > -35:
+        return "Baisse maximale importante. Il faut pouvoir supporter ces pertes temporaires." + duration
+    else:
+        return "Baisse maximale sévère, comparable aux grands krachs boursiers." + duration
+
+
+def interpret_sortino_ratio(sortino_ratio):
+    """
+    Interprets Sortino ratio value (return per unit of downside risk)
+    """
+    if sortino_ratio < 0:
+        return "Ratio négatif. Le rendement ne dépasse pas le taux sans risque."
+    elif sortino_ratio < 1:
+        return "Ratio faible. Les baisses sont importantes par rapport au rendement obtenu."
+    elif sortino_ratio < 2:
+        return "Bon ratio. Le rendement compense bien les baisses subies."
+    else:
+        return "Excellent ratio. Rendement élevé avec peu de baisses."
+
+
+def interpret_calmar_ratio(calmar_ratio):
+    """
+    Interprets Calmar ratio value (annual return over the maximum drawdown)
+    """
+    if calmar_ratio < 0:
+        return "Ratio négatif. Le portefeuille perd de la valeur en moyenne."
+    elif calmar_ratio < 0.5:
+        return "Ratio faible. La baisse maximale représente plusieurs années de rendement."
+    elif calmar_ratio < 1:
+        return "Ratio correct. Environ une à deux années de rendement pour effacer la baisse maximale."
+    else:
+        return "Très bon ratio. Le rendement annuel dépasse la baisse maximale."
+
+
 def interpret_performance_vs_investment(final_value, amount_invested, date_list):
     """
     Interprets overall performance (gain/loss vs invested amount) considering time period
@@ -243,48 +470,41 @@ def interpret_cash_reserve(cash_reserve, total_portfolio_value):
         return f"{cash_percentage:.1f}% en liquidités. Réserve très élevée, manque d'opportunités d'investissement."
 
 
-def get_all_interpretations(metrics_dict, date_list):
+def get_all_interpretations(result, date_list):
     """
-    Generates all interpretations from the metrics dictionary
+    Generates all interpretations from the raw metrics
     """
-    # Extract numeric values from formatted strings
-    amount_invested = float(metrics_dict["Montant investi"].replace(" €", "").replace(",", ""))
-    final_value = float(metrics_dict["Valeur du portefeuille"].replace(" €", "").replace(",", ""))
-    cash_reserve = float(metrics_dict["Cash non investi"].replace(" €", "").replace(",", ""))
-    cagr = float(metrics_dict["CAGR"].replace(" %", ""))
-    volatility = float(metrics_dict["Volatilité annualisée"].replace(" %", ""))
-    sharpe_ratio = float(metrics_dict["Ratio de Sharpe"])
-    
     interpretations = {
-        "Montant investi": f"Capital total: {amount_invested:,.0f}€ déployé sur la période d'investissement.",
-        "Valeur du portefeuille": interpret_performance_vs_investment(final_value, amount_invested, date_list),
-        "Cash non investi": interpret_cash_reserve(cash_reserve, final_value + cash_reserve),
-        "CAGR": interpret_cagr(cagr),
-        "Volatilité annualisée": interpret_volatility(volatility),
-        "Ratio de Sharpe": interpret_sharpe_ratio(sharpe_ratio)
+        "Montant investi": f"Capital total: {result.invested:,.0f}€ déployé sur la période d'investissement.",
+        "Valeur du portefeuille": interpret_performance_vs_investment(result.final_value, result.invested, date_list),
+        "Cash non investi": interpret_cash_reserve(result.cash_reserve, result.final_value + result.cash_reserve),
+        "CAGR": interpret_cagr(result.cagr * 100),
+        "Volatilité annualisée": interpret_volatility(result.volatility * 100),
+        "Ratio de Sharpe": interpret_sharpe_ratio(result.sharpe_ratio),
+        "Rendement pondéré (TWR)": interpret_time_weighted_return(result.twr * 100, result.cagr * 100),
+        "Baisse maximale": interpret_max_drawdown(result.max_drawdown * 100, result.drawdown_months),
+        "Ratio de Sortino": interpret_sortino_ratio(result.sortino_ratio),
+        "Ratio de Calmar": interpret_calmar_ratio(result.calmar_ratio)
     }
     
     return interpretations
 
 
-def get_metrics_with_interpretations(portfolio_values, dates, portfolio):
+def get_metrics_with_interpretations(result, dates):
     """
-    Calculates metrics with their interpretations
+    Formats metrics with their interpretations
     """
-    from metrics import calculate_portfolio_metrics
-    
-    # Calculate base metrics
-    metrics = calculate_portfolio_metrics(portfolio_values, dates, portfolio)
+    metrics = format_metrics(result)
     
     # Add interpretations (now includes date context)
-    interpretations = get_all_interpretations(metrics, dates)
+    interpretations = get_all_interpretations(result, dates)
     
     # Combine metrics and interpretations
-    result = {}
+    combined = {}
     for key in metrics.keys():
-        result[key] = {
+        combined[key] = {
             "value": metrics[key],
             "interpretation": interpretations[key]
         }
     
-    return result
\ No newline at end of file
+    return combined
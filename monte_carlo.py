@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# Percentiles of the fan bands, from the pessimistic to the optimistic path
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class Projection:
+    """
+    Monte Carlo projection of a portfolio value over future months
+    """
+    dates: pd.DatetimeIndex
+    percentiles: tuple
+    bands: np.ndarray         # (percentiles x months) values
+    final_values: np.ndarray  # value of every path at the last month
+
+
+def contribution_adjusted_returns(values, contributions):
+    """
+    Get the monthly returns of a simulated portfolio, without the effect of contributions
+    values[t] = values[t - 1] * (1 + return[t]) + contributions[t]
+    Months following a zero value (nothing invested yet) have no return
+    """
+    values = np.asarray(values, dtype=float)
+    contributions = np.asarray(contributions, dtype=float)
+
+    previous = values[:-1]
+    invested = previous > 0
+    return (values[1:][invested] - contributions[1:][invested]) / previous[invested] - 1
+
+
+def contribution_schedule(months, recurring_contribution, months_between, first_month):
+    """
+    Get the contributions of the next months, following the simulation schedule
+    (a contribution every months_between months since the first simulated month)
+    first_month is the position of the first future month, counted from the first simulated month
+    """
+    positions = first_month + np.arange(months)
+    return np.where(positions % months_between == 0, float(recurring_contribution), 0.0)
+
+
+def _block_growth(returns, block_size, dtype):
+    """
+    Get the cumulative growth within every block of consecutive historical months
+    Returns a (block_size x possible block starts) matrix
+    """
+    log_growth = np.log1p(returns)
+    windows = np.lib.stride_tricks.sliding_window_view(log_growth, block_size)
+    return np.exp(np.cumsum(windows, axis=1)).T.astype(dtype)
+
+
+def simulate_paths(returns, initial_value, contributions, n_paths=10000, block_size=12, seed=None,
+                   dtype=np.float32):
+    """
+    Simulate future values by block bootstrap of the historical monthly returns
+    Every path chains blocks of block_size consecutive historical months drawn at random
+    (block_size=1 is a plain bootstrap), to keep the short-term dependence of the returns.
+    contributions[h] is added at the end of future month h.
+    Yields the (months of the block x n_paths) values of each block, in order
+    (the yielded array is reused for the next block)
+    """
+    returns = np.asarray(returns, dtype=float)
+    contributions = np.asarray(contributions, dtype=float)
+    if len(returns) == 0:
+        raise ValueError("At least one historical return is required")
+
+    block_size = min(block_size, len(returns))
+    growth = _block_growth(returns, block_size, dtype)
+    rng = np.random.default_rng(seed)
+
+    # Buffers reused by every block (allocating large arrays for each block is slower)
+    growth_buffer = np.empty((block_size, n_paths), dtype=dtype)
+    values_buffer = np.empty((block_size, n_paths), dtype=dtype)
+
+    values = np.full(n_paths, initial_value, dtype=dtype)
+    for first in range(0, len(contributions), block_size):
+        block_contributions = contributions[first:first + block_size].astype(dtype)[:, np.newaxis]
+        months = len(block_contributions)
+
+        # Growth since the start of the block, for each month of the block and each path
+        block_growth = growth_buffer[:months]
+        np.take(growth[:months], rng.integers(0, growth.shape[1], n_paths), axis=1, out=block_growth)
+
+        # Closed form of values[h] = values[h - 1] * growth[h] / growth[h - 1] + contributions[h]:
+        # values[h] = growth[h] * (initial values + cumulative sum of contributions[i] / growth[i])
+        block_values = values_buffer[:months]
+        np.divide(block_contributions, block_growth, out=block_values)
+        block_values[0] += values
+        for month in range(1, len(block_values)):
+            # Row by row: much faster than np.cumsum(axis=0) for a few long rows
+            block_values[month] += block_values[month - 1]
+        block_values *= block_growth
+
+        values = block_values[-1].copy()
+        yield block_values
+
+
+def fan_bands(blocks, percentiles=PERCENTILES):
+    """
+    Get the percentiles of the simulated values at each month (the blocks are sorted in place)
+    Returns the (percentiles x months) bands and the values of every path at the last month
+    """
+    bands = []
+    values = None
+    for values in blocks:
+        values.sort(axis=1)
+
+        # Linear interpolation between the closest ranks, like np.percentile
+        positions = np.asarray(percentiles, dtype=float) / 100 * (values.shape[1] - 1)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, values.shape[1] - 1)
+        fraction = positions - lower
+        bands.append(values[:, lower] * (1 - fraction) + values[:, upper] * fraction)
+
+    return np.concatenate(bands).T.astype(float), values[-1].astype(float)
+
+
+def project(returns, initial_value, contributions, n_paths=10000, block_size=12, percentiles=PERCENTILES,
+            seed=None):
+    """
+    Project a portfolio value over len(contributions) months
+    Returns the (percentiles x months) fan bands and the final value of every path
+    """
+    return fan_bands(
+        simulate_paths(returns, initial_value, contributions, n_paths=n_paths, block_size=block_size, seed=seed),
+        percentiles
+    )
+
+
+def project_portfolio(df, invested_amount, recurring_contribution, months_between, months=120, n_paths=10000,
+                      block_size=12, percentiles=PERCENTILES, seed=None):
+    """
+    Project a simulated portfolio (InvestmentSimulator.simulate() dataframe) over the next months,
+    continuing its recurring contributions
+    invested_amount is the total invested at each simulated month (get_invested_amount)
+    """
+    values = df["Portfolio Value"].values
+    contributions = np.diff(np.asarray(invested_amount, dtype=float), prepend=invested_amount[0])
+
+    bands, final_values = project(
+        contribution_adjusted_returns(values, contributions),
+        values[-1],
+        contribution_schedule(months, recurring_contribution, months_between, first_month=len(values)),
+        n_paths=n_paths,
+        block_size=block_size,
+        percentiles=percentiles,
+        seed=seed
+    )
+
+    dates = pd.date_range(df.index[-1] + pd.offsets.MonthBegin(1), periods=months, freq='MS')
+    return Projection(dates=dates, percentiles=tuple(percentiles), bands=bands, final_values=final_values)
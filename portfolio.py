@@ -1,6 +1,5 @@
 import pandas as pd
 from etf_search import get_etf_name
-import yfinance as yf
 
 class Asset:
     def __init__(self, ticker, weight, fee=0.0):
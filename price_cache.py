@@ -0,0 +1,415 @@
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from providers import get_provider
+
+# Default location of the local price store (one directory per provider,
+# with daily and monthly .npy files per ticker + index.json)
+CACHE_DIR = os.environ.get(
+    "PRICE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "prices")
+)
+
+# On-disk layout of a ticker file: adjusted daily closes, sorted by date
+PRICE_DTYPE = np.dtype([("date", "datetime64[D]"), ("close", "float64")])
+
+# On-disk layout of a ticker monthly file, written with the daily file: one row per month (no gaps)
+# from the month after the first close, with the last close of the previous month (NaN if none)
+MONTHLY_DTYPE = np.dtype([("month", "datetime64[M]"), ("close", "float64")])
+
+# Cached days downloaded again around each missing range, to compare the adjustment of both:
+# adjusted closes of the whole history are rescaled by the provider after each dividend or split
+OVERLAP = pd.Timedelta(days=10)
+
+# Relative difference of a common close above which the history is considered adjusted again
+# (below, it is rounding)
+ADJUSTMENT_TOLERANCE = 1e-6
+
+# First date fetched by the nightly refresh (the form starts in 2000, minus one month)
+REFRESH_START = "1999-12-01"
+
+
+class PriceCache:
+    def __init__(self, provider=None, cache_dir=None):
+        self.provider = provider if provider is not None else get_provider()
+        self.cache_dir = cache_dir if cache_dir is not None else os.path.join(CACHE_DIR, self.provider.name)
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.lock_path = os.path.join(self.cache_dir, ".lock")
+
+    def _price_path(self, ticker):
+        return os.path.join(self.cache_dir, f"{ticker}.npy")
+
+    def _monthly_path(self, ticker):
+        return os.path.join(self.cache_dir, f"{ticker}.monthly.npy")
+
+    def load_index(self):
+        """
+        Load the metadata index: covered date range [start, end) per ticker
+        """
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, index):
+        atomic_write(self.index_path, lambda f: f.write(json.dumps(index, indent=1, sort_keys=True).encode("utf-8")))
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the cache lock, shared with the other processes (workers, nightly refresh),
+        so that two read-merge-write of the ticker files and of the index do not lose updates
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, ticker):
+        """
+        Read the cached daily closes of a ticker (empty array if not cached)
+        """
+        try:
+            return np.load(self._price_path(ticker))
+        except FileNotFoundError:
+            return np.empty(0, dtype=PRICE_DTYPE)
+
+    def read_monthly(self, ticker):
+        """
+        Read the cached month-start prices of a ticker (empty array if not cached)
+        """
+        try:
+            return np.load(self._monthly_path(ticker))
+        except FileNotFoundError:
+            # Daily file cached before monthly files existed
+            records = self.read(ticker)
+            if not len(records):
+                return np.empty(0, dtype=MONTHLY_DTYPE)
+            monthly = _to_monthly(records)
+            atomic_write(self._monthly_path(ticker), lambda f: np.save(f, monthly))
+            return monthly
+
+    def stamp(self, ticker):
+        """
+        Get the modification time of the stored monthly prices of a ticker (None if not cached)
+        It changes with every rewrite, ex. when the history is rescaled to a new adjustment
+        """
+        try:
+            return os.stat(self._monthly_path(ticker)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _write(self, ticker, records):
+        atomic_write(self._price_path(ticker), lambda f: np.save(f, records))
+
+        # Resample once at ingestion rather than on every request
+        monthly = _to_monthly(records)
+        atomic_write(self._monthly_path(ticker), lambda f: np.save(f, monthly))
+
+    def missing_ranges(self, ticker, start, end, index=None):
+        """
+        Get the date ranges of [start, end) not covered by the cache for a ticker
+        A range disjoint from the coverage is extended up to it, so that the coverage stays
+        a single range without gaps
+        """
+        if index is None:
+            index = self.load_index()
+
+        coverage = index.get(ticker)
+        if coverage is None:
+            return [(start, end)]
+
+        covered_start = pd.Timestamp(coverage["start"])
+        covered_end = pd.Timestamp(coverage["end"])
+
+        missing = []
+        if start < covered_start:
+            missing.append((start, covered_start))
+        if end > covered_end:
+            missing.append((covered_end, end))
+        return missing
+
+    def _append(self, ticker, records, new_records, rescaled=False):
+        """
+        Append newly downloaded records after the last cached date of the ticker file
+        """
+        if len(records):
+            new_records = new_records[new_records["date"] > records["date"][-1]]
+        if len(new_records) or rescaled:
+            self._write(ticker, np.concatenate([records, new_records]))
+
+    def _merge(self, ticker, records, new_records):
+        """
+        Merge newly downloaded records into the ticker file
+        """
+        records = np.concatenate([records, new_records])
+
+        # Keep the last occurrence of each date (fresh download wins), sorted by date
+        _, last_positions = np.unique(records["date"][::-1], return_index=True)
+        records = records[len(records) - 1 - last_positions]
+
+        self._write(ticker, records)
+
+    def update(self, tickers, start, end):
+        """
+        Download the ranges of [start, end) missing from the cache for the tickers
+        A range after the cached coverage only appends the missing tail, unless the provider
+        adjusted the history again (then the cached closes are rescaled first)
+        """
+        index = self.load_index()
+
+        # Group tickers sharing the same missing range to download them together
+        to_download = {}
+        for ticker in tickers:
+            for missing_range in self.missing_ranges(ticker, start, end, index):
+                if missing_range[0] < missing_range[1]:
+                    to_download.setdefault(missing_range, []).append(ticker)
+
+        for (range_start, range_end), range_tickers in to_download.items():
+            # A few cached days on each side, to compare with the cached closes
+            overlap_end = max(min(range_end + OVERLAP, pd.Timestamp.today().normalize()), range_end)
+            data = self.provider.download(range_tickers, range_start - OVERLAP, overlap_end)
+
+            # An empty answer is most likely a network failure: do not record coverage
+            if data.empty:
+                continue
+
+            # Download outside of the lock, merge under it: files and coverage are read again,
+            # with what other processes wrote meanwhile
+            with self._locked():
+                index = self.load_index()
+                downloaded = []
+                for ticker in range_tickers:
+                    # A missing or empty column is how a batch reports the failure of one ticker:
+                    # its range stays missing, to be downloaded again next time
+                    if ticker not in data.columns or not data[ticker].notna().any():
+                        continue
+
+                    coverage = index.get(ticker)
+                    records = self.read(ticker)
+                    new_records = _to_records(data[ticker])
+                    rebased = _rebase(records, new_records)
+                    covered_start = range_start
+
+                    if rebased is None:
+                        # Nothing to compare the adjustments with: download the whole history again
+                        if coverage is not None:
+                            covered_start = min(range_start, pd.Timestamp(coverage["start"]))
+                        history = self.provider.download([ticker], covered_start, overlap_end)
+                        if ticker not in history.columns or not history[ticker].notna().any():
+                            continue
+                        self._write(ticker, _to_records(history[ticker]))
+                    elif coverage is not None and range_start >= pd.Timestamp(coverage["end"]):
+                        self._append(ticker, rebased, new_records, rescaled=rebased is not records)
+                    else:
+                        self._merge(ticker, rebased, new_records)
+                    downloaded.append((ticker, covered_start))
+
+                if downloaded:
+                    for ticker, covered_start in downloaded:
+                        coverage = index.get(ticker)
+                        if coverage is None:
+                            index[ticker] = {"start": str(covered_start.date()), "end": str(range_end.date())}
+                        else:
+                            coverage["start"] = str(min(pd.Timestamp(coverage["start"]), covered_start).date())
+                            coverage["end"] = str(max(pd.Timestamp(coverage["end"]), range_end).date())
+                    self._save_index(index)
+
+    def get_prices(self, tickers, start, end):
+        """
+        Get adjusted daily closes of the tickers on [start, end)
+        Only the ranges missing from the cache are downloaded from the provider
+        """
+        start = pd.Timestamp(start).normalize()
+        # Today's bar is not final yet, so the cache never covers it
+        end = min(pd.Timestamp(end).normalize(), pd.Timestamp.today().normalize())
+
+        self.update(tickers, start, end)
+
+        # Build the requested window from the cached files
+        columns = {}
+        for ticker in tickers:
+            records = self.read(ticker)
+            in_range = (records["date"] >= np.datetime64(start.date())) & (records["date"] < np.datetime64(end.date()))
+            columns[ticker] = pd.Series(
+                records["close"][in_range],
+                index=pd.DatetimeIndex(records["date"][in_range].astype("datetime64[ns]"))
+            )
+
+        data = pd.DataFrame(columns, columns=list(tickers))
+        data.index.name = "Date"
+        return data
+
+    def monthly_window(self, tickers, start, end):
+        """
+        Read the cached month-start prices of the tickers for every month from the month of start to end
+        Each ticker's window is sliced by its month offset, NaN outside of its cached months
+        """
+        months = pd.date_range(pd.Timestamp(start).to_period("M").to_timestamp(), end, freq="MS", name="Date")
+        first_month = np.datetime64(months[0].date(), "M") if len(months) else None
+
+        columns = {}
+        for ticker in tickers:
+            closes = np.full(len(months), np.nan)
+            records = self.read_monthly(ticker)
+            if len(records) and len(months):
+                offset = int((first_month - records["month"][0]).astype(int))
+                first, last = max(offset, 0), min(offset + len(months), len(records))
+                if first < last:
+                    closes[first - offset:last - offset] = records["close"][first:last]
+            columns[ticker] = closes
+
+        return pd.DataFrame(columns, index=months, columns=list(tickers))
+
+    def get_monthly_prices(self, tickers, start, end):
+        """
+        Get the month-start prices of the tickers for every month from the month of start to end
+        For a month, the price is the last close of the previous month.
+        Only the daily ranges missing from the cache are downloaded from the provider
+        """
+        month_start = pd.Timestamp(start).to_period("M").to_timestamp()
+        end = min(pd.Timestamp(end), pd.Timestamp.today().normalize())
+
+        # The first month needs the closes of the previous month
+        self.update(tickers, month_start - pd.DateOffset(months=1), end.normalize())
+
+        return self.monthly_window(tickers, month_start, end)
+
+
+def _to_records(closes):
+    """
+    Convert a Series of closes indexed by date into on-disk records
+    """
+    closes = closes.dropna()
+    records = np.empty(len(closes), dtype=PRICE_DTYPE)
+    records["date"] = closes.index.values.astype("datetime64[D]")
+    records["close"] = closes.values
+    return records
+
+
+def _rebase(records, new_records):
+    """
+    Rescale cached records to the adjustment of newly downloaded ones, compared on their last
+    common date (a dividend or split after the cached dates rescales all of them by the same factor)
+    Returns the records themselves if both agree, None if they have no common date
+    """
+    if not len(records):
+        return records
+
+    _, positions, new_positions = np.intersect1d(records["date"], new_records["date"], return_indices=True)
+    if not len(positions):
+        return None
+
+    ratio = new_records["close"][new_positions[-1]] / records["close"][positions[-1]]
+    if abs(ratio - 1) <= ADJUSTMENT_TOLERANCE:
+        return records
+
+    rescaled = records.copy()
+    rescaled["close"] *= ratio
+    return rescaled
+
+
+def _to_monthly(records):
+    """
+    Convert daily records (sorted by date) into monthly records: for each month, the last close
+    of the previous month
+    """
+    if not len(records):
+        return np.empty(0, dtype=MONTHLY_DTYPE)
+
+    months = records["date"].astype("datetime64[M]")
+    # Position of the last close of each month
+    last_positions = np.flatnonzero(np.append(months[1:] != months[:-1], True))
+
+    count = int((months[-1] - months[0]).astype(int)) + 1
+    monthly = np.empty(count, dtype=MONTHLY_DTYPE)
+    monthly["month"] = months[0] + 1 + np.arange(count)
+    monthly["close"] = np.nan
+    monthly["close"][(months[last_positions] - months[0]).astype(int)] = records["close"][last_positions]
+    return monthly
+
+
+def atomic_write(path, write):
+    """
+    Write a file through a temporary file and an atomic rename,
+    so that concurrent readers never see a half-written file
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Shared cache instance for the application
+_cache = PriceCache()
+
+
+def get_price_cache():
+    """
+    Get the shared cache of the configured provider
+    """
+    return _cache
+
+
+def universe_symbols():
+    """
+    Get the symbols kept up to date: every ETF of etfs.csv and the ACWI benchmark
+    """
+    from etf_search import load_etfs
+    symbols = [etf['symbol'] for etf in load_etfs()]
+    if "ACWI" not in symbols:
+        symbols.append("ACWI")
+    return symbols
+
+
+def get_daily_prices(tickers, start, end):
+    """
+    Get adjusted daily closes of the tickers on [start, end) through the local cache
+    """
+    return _cache.get_prices(tickers, start, end)
+
+
+def get_monthly_prices(tickers, start, end):
+    """
+    Get month-start prices of the tickers from the month of start to end through the local cache
+    """
+    return _cache.get_monthly_prices(tickers, start, end)
+
+
+def refresh_prices(symbols=None, start=REFRESH_START):
+    """
+    Bring the cache up to date for every ETF of etfs.csv (and the ACWI benchmark)
+    Meant to be run overnight by a cron job: python price_cache.py
+    """
+    if symbols is None:
+        symbols = universe_symbols()
+
+    end = pd.Timestamp.today().normalize()
+    _cache.update(symbols, pd.Timestamp(start), end)
+
+    index = _cache.load_index()
+    missing = [symbol for symbol in symbols if symbol not in index]
+    print(f"Refreshed {len(symbols) - len(missing)}/{len(symbols)} symbols up to {end.date()}")
+    if missing:
+        print(f"Not refreshed: {', '.join(missing)}")
+
+
+if __name__ == '__main__':
+    from price_matrix import build_price_matrix
+    refresh_prices()
+    build_price_matrix()
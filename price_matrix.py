@@ -0,0 +1,161 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from price_cache import atomic_write, get_price_cache, universe_symbols
+
+# Index of the current matrix file (file name, tickers, month-start dates, cached coverage of each ticker),
+# next to the daily cache
+INDEX_FILE = "monthly.json"
+
+
+class PriceMatrix:
+    """
+    Month-start prices of the ETF universe, memory-mapped from a (tickers x months) float64 .npy file,
+    so that every worker process shares the same pages instead of keeping its own copy.
+    For a month, the price is the last close of the previous month (NaN before a ticker's history
+    and after its cached coverage)
+    """
+
+    def __init__(self, directory):
+        index_path = os.path.join(directory, INDEX_FILE)
+        self.mtime = os.stat(index_path).st_mtime_ns
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.tickers = index["tickers"]
+        self.positions = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.dates = pd.DatetimeIndex(index["dates"], name="Date")
+        self.coverage = {
+            ticker: (pd.Timestamp(start), pd.Timestamp(end)) for ticker, (start, end) in index.get("coverage", {}).items()
+        }
+        self.prices = np.load(os.path.join(directory, index["file"]), mmap_mode="r")
+
+    def covers(self, tickers, start, end):
+        """
+        Check if the matrix has every ticker for every month from start to end, within the range
+        each ticker was cached for (the closes of the previous month are needed for the first month)
+        """
+        first_month = _month_start(start)
+        end = pd.Timestamp(end)
+        return (
+            len(self.dates) > 0
+            and all(ticker in self.positions for ticker in tickers)
+            and self.dates[0] <= first_month
+            and end <= self.dates[-1]
+            and all(
+                ticker in self.coverage
+                and self.coverage[ticker][0] <= first_month - pd.DateOffset(months=1)
+                and end <= self.coverage[ticker][1]
+                for ticker in tickers
+            )
+        )
+
+    def window(self, tickers, start, end):
+        """
+        Get the month-start prices of the tickers from the month of start to end, one column per ticker
+        The rows of the tickers are sliced from the mapped file by month offset, so only the window
+        itself is copied
+        """
+        first = max(_month_offset(self.dates[0], start), 0)
+        last = min(_month_offset(self.dates[0], end) + 1, len(self.dates))
+
+        columns = {ticker: self.prices[self.positions[ticker], first:last] for ticker in tickers}
+        return pd.DataFrame(columns, index=self.dates[first:last], columns=list(tickers))
+
+
+def _month_start(date):
+    return pd.Timestamp(date).to_period("M").to_timestamp()
+
+
+def _month_offset(first_month, date):
+    """
+    Get the number of months from first_month to the month of date
+    """
+    date = pd.Timestamp(date)
+    return (date.year - first_month.year) * 12 + date.month - first_month.month
+
+
+def build_price_matrix(symbols=None, cache=None):
+    """
+    Stack the cached monthly series of the universe into the shared month-start matrix
+    Never downloads: meant to run after the nightly refresh (python price_cache.py runs both)
+    """
+    if cache is None:
+        cache = get_price_cache()
+    if symbols is None:
+        symbols = universe_symbols()
+
+    # Symbols missing from the cache (or from its index) are left out, so requests fall back to the provider
+    cached_index = cache.load_index()
+    first_months = {}
+    for symbol in symbols:
+        records = cache.read_monthly(symbol)
+        if len(records) and symbol in cached_index:
+            first_months[symbol] = records["month"][0]
+
+    # Months up to the current one (the close of the previous month is final)
+    if first_months:
+        start = pd.Timestamp(min(first_months.values()))
+    else:
+        start = _month_start(pd.Timestamp.today())
+    monthly = cache.monthly_window(list(first_months), start, _month_start(pd.Timestamp.today()))
+
+    # Months after the cached coverage of a ticker have no final price (at most a close in the middle
+    # of the previous month, from a download overlapping the coverage)
+    coverage = {symbol: cached_index[symbol] for symbol in monthly.columns}
+    for symbol in monthly.columns:
+        monthly.loc[monthly.index > pd.Timestamp(coverage[symbol]["end"]), symbol] = np.nan
+
+    matrix = np.ascontiguousarray(monthly.to_numpy(dtype=float).T)
+
+    # A new file name for each build: workers still mapping the previous file keep valid data
+    file_name = f"monthly-{time.time_ns()}.npy"
+    atomic_write(os.path.join(cache.cache_dir, file_name), lambda f: np.save(f, matrix))
+
+    index = {
+        "file": file_name,
+        "tickers": list(monthly.columns),
+        "dates": [str(date.date()) for date in monthly.index],
+        "coverage": {symbol: [covered["start"], covered["end"]] for symbol, covered in coverage.items()}
+    }
+    atomic_write(
+        os.path.join(cache.cache_dir, INDEX_FILE),
+        lambda f: f.write(json.dumps(index).encode("utf-8"))
+    )
+
+    # Remove the previous builds (a mapped file stays readable after its removal)
+    for name in os.listdir(cache.cache_dir):
+        if name.startswith("monthly-") and name.endswith(".npy") and name != file_name:
+            os.remove(os.path.join(cache.cache_dir, name))
+
+    print(f"Price matrix built: {matrix.shape[0]} symbols x {matrix.shape[1]} months")
+
+
+# Matrix of the current process, reopened when the index file changes (after a rebuild)
+_matrix = None
+_matrix_mtime = None
+
+
+def get_price_matrix():
+    """
+    Get the price matrix of the configured provider (None if it was never built)
+    """
+    global _matrix, _matrix_mtime
+
+    directory = get_price_cache().cache_dir
+    try:
+        mtime = os.stat(os.path.join(directory, INDEX_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if mtime != _matrix_mtime:
+        _matrix = PriceMatrix(directory)
+        _matrix_mtime = mtime
+
+    return _matrix
+
+
+if __name__ == '__main__':
+    build_price_matrix()
@@ -0,0 +1,157 @@
+import os
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+
+class PriceProvider:
+    """
+    Source of market data: adjusted daily closes and ETF expense ratios
+    """
+    name = "base"
+
+    def download(self, tickers, start, end):
+        """
+        Get adjusted daily closes on [start, end), one column per ticker
+        """
+        raise NotImplementedError
+
+    def expense_ratio(self, symbol):
+        """
+        Get the net expense ratio of a symbol (None if not available)
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(PriceProvider):
+    name = "yfinance"
+
+    def download(self, tickers, start, end):
+        import yfinance as yf
+
+        data = yf.download(
+            list(tickers),
+            start=start,
+            end=end,
+            interval="1d",
+            auto_adjust=True)["Close"]
+
+        # If only one instance of ticker, dataframe structure instead of series
+        if isinstance(data, pd.Series):
+            data = data.to_frame(tickers[0])
+
+        if data.index.tz is not None:
+            data.index = data.index.tz_localize(None)
+
+        return data
+
+    def expense_ratio(self, symbol):
+        import yfinance as yf
+        return yf.Ticker(symbol).info.get('netExpenseRatio')
+
+
+class LocalFileProvider(PriceProvider):
+    """
+    Prices read from a directory with one file per ticker: SYMBOL.csv (Date, Close columns)
+    or SYMBOL.parquet, and optional expense ratios in expense_ratios.csv (symbol, expense_ratio)
+    """
+    name = "local"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._series = {}
+        self._expense_ratios = None
+
+    def _read(self, ticker):
+        if ticker not in self._series:
+            parquet_path = os.path.join(self.directory, f"{ticker}.parquet")
+            csv_path = os.path.join(self.directory, f"{ticker}.csv")
+            if os.path.exists(parquet_path):
+                data = pd.read_parquet(parquet_path)
+            elif os.path.exists(csv_path):
+                data = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+            else:
+                data = pd.DataFrame({"Close": []}, index=pd.DatetimeIndex([]))
+            self._series[ticker] = data["Close"].astype(float).sort_index()
+        return self._series[ticker]
+
+    def download(self, tickers, start, end):
+        columns = {}
+        for ticker in tickers:
+            closes = self._read(ticker)
+            columns[ticker] = closes[(closes.index >= start) & (closes.index < end)]
+        return pd.DataFrame(columns, columns=list(tickers))
+
+    def expense_ratio(self, symbol):
+        if self._expense_ratios is None:
+            path = os.path.join(self.directory, "expense_ratios.csv")
+            if os.path.exists(path):
+                table = pd.read_csv(path)
+                self._expense_ratios = dict(zip(table["symbol"].str.upper(), table["expense_ratio"]))
+            else:
+                self._expense_ratios = {}
+        return self._expense_ratios.get(symbol.upper())
+
+
+class SyntheticProvider(PriceProvider):
+    """
+    Deterministic random-walk prices (same seed and ticker, same prices), with a fixed latency per call
+    """
+    name = "synthetic"
+
+    # Every series starts at 100 on this date, so any window of a ticker is reproducible
+    ORIGIN = pd.Timestamp("1990-01-01")
+
+    def __init__(self, seed=0, latency=0.0):
+        self.seed = seed
+        self.latency = latency  # in seconds
+
+    def _rng(self, ticker):
+        return np.random.default_rng([self.seed, zlib.crc32(ticker.encode("utf-8"))])
+
+    def download(self, tickers, start, end):
+        time.sleep(self.latency)
+
+        days = pd.bdate_range(self.ORIGIN, pd.Timestamp(end) - pd.Timedelta(days=1))
+        columns = {}
+        for ticker in tickers:
+            rng = self._rng(ticker)
+            annual_return, annual_volatility = rng.uniform(0.02, 0.10), rng.uniform(0.05, 0.30)
+            daily_returns = rng.normal(annual_return / 252, annual_volatility / np.sqrt(252), len(days))
+            columns[ticker] = 100 * np.exp(np.cumsum(daily_returns))
+
+        data = pd.DataFrame(columns, index=days, columns=list(tickers))
+        return data[data.index >= start]
+
+    def expense_ratio(self, symbol):
+        time.sleep(self.latency)
+        return round(float(self._rng(symbol).uniform(0.0003, 0.0075)) * 100, 2)
+
+
+_provider = None
+
+
+def get_provider():
+    """
+    Get the configured price provider
+    PRICE_PROVIDER: 'yfinance' (default), 'local' (files in PRICE_DATA_DIR) or 'synthetic'
+    (SYNTHETIC_SEED, PROVIDER_LATENCY_MS)
+    """
+    global _provider
+
+    if _provider is None:
+        kind = os.environ.get("PRICE_PROVIDER", "yfinance")
+        if kind == "yfinance":
+            _provider = YFinanceProvider()
+        elif kind == "local":
+            _provider = LocalFileProvider(os.environ.get("PRICE_DATA_DIR", "market_data"))
+        elif kind == "synthetic":
+            _provider = SyntheticProvider(
+                seed=int(os.environ.get("SYNTHETIC_SEED", 0)),
+                latency=float(os.environ.get("PROVIDER_LATENCY_MS", 0)) / 1000
+            )
+        else:
+            raise ValueError(f"Unknown price provider: {kind}")
+
+    return _provider
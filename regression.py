@@ -1,14 +1,13 @@
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 import plotly.graph_objects as go
+from trend import fit_trend
 
-def regression(dates, values, scale='linear'):
+def regression(dates, values, scale='linear', fit=None):
     """
     Linear regression 
+    fit is the trend already fitted on these values, if any
     """
-    base_date = dates[0]
-    X = np.array([(d - base_date).days for d in dates]).reshape(-1, 1)
     y_raw = np.array(values)
     
     # Basic validations
@@ -21,20 +20,14 @@ def regression(dates, values, scale='linear'):
     if scale == 'log' and np.any(y_raw <= 0):
         raise ValueError("Values must be positive for log scale")
 
-    # Data transformation based on scale
-    if scale == 'log':
-        y = np.log(y_raw)
-    else:
-        y = y_raw.copy()
-
-    # Linear regression
-    model = LinearRegression()
-    model.fit(X, y)
-    y_pred = model.predict(X)
+    # Linear regression (on log values for the log scale)
+    if fit is None:
+        fit = fit_trend(dates, y_raw, scale=scale)
+    y_pred = fit.fitted
 
     # Calculate residuals
-    residuals = y - y_pred
-    std_residuals = np.std(residuals)
+    residuals = fit.residuals
+    std_residuals = fit.sigma
     
     if scale == 'log':
         # In log scale, std_residuals is already in relative units
@@ -48,11 +41,11 @@ def regression(dates, values, scale='linear'):
             std_residuals_percent = 0
     
     # Extract slope and intercept
-    slope = float(model.coef_[0])
-    intercept = float(model.intercept_)
+    slope = fit.slope
+    intercept = fit.intercept
     
     # Calculate R²
-    r2 = model.score(X, y)
+    r2 = fit.r2
     
 
     if scale == 'log':
@@ -91,6 +84,7 @@ def regression(dates, values, scale='linear'):
     
     return {
         "predicted": y_pred,
+        "fit": fit,                             # Reusable by plot_regression
         "slope": slope,
         "intercept": intercept,
         "r2": r2,
@@ -102,52 +96,21 @@ def regression(dates, values, scale='linear'):
     }
 
 
-def plot_regression(df, scale='linear', future_months=12):
+def plot_regression(df, scale='linear', future_months=12, fit=None):
     """
     Generate regression plot with projections
+    fit is the trend already fitted on the portfolio values, if any
     """
     dates = df.index.to_list()
     values = df["Portfolio Value"].values
-    base_date = dates[0]
-
-    # Convert dates to days
-    X = np.array([(d - base_date).days for d in dates]).reshape(-1, 1)
-    X_future = np.array([(d - base_date).days for d in pd.date_range(dates[0], dates[-1] + pd.DateOffset(months=future_months), freq='MS')]).reshape(-1, 1)
-
-    # Regression model
-    model = LinearRegression()
-    if scale == 'log':
-        y = np.log(values)
-    else:
-        y = values
-    
-    model.fit(X, y)
-    y_pred_future = model.predict(X_future)
-    y_pred_current = model.predict(X)
-
-    # Convert predictions back to original space if necessary
-    if scale == 'log':
-        y_pred_future = np.exp(y_pred_future)
-        y_real = values
-    else:
-        y_real = values
+    y_real = values
 
-    residuals = y - y_pred_current
-    sigma = np.std(residuals)
-
-    # Confidence bands
-    if scale == 'log':
-        upper_1 = np.exp(model.predict(X_future) + sigma)
-        lower_1 = np.exp(model.predict(X_future) - sigma)
-        upper_2 = np.exp(model.predict(X_future) + 2 * sigma)
-        lower_2 = np.exp(model.predict(X_future) - 2 * sigma)
-    else:
-        upper_1 = model.predict(X_future) + sigma
-        lower_1 = model.predict(X_future) - sigma
-        upper_2 = model.predict(X_future) + 2 * sigma
-        lower_2 = model.predict(X_future) - 2 * sigma
+    if fit is None:
+        fit = fit_trend(dates, values, scale=scale)
 
+    # Regression line and ±1σ, ±2σ confidence bands, in one projection
     future_dates = pd.date_range(dates[0], dates[-1] + pd.DateOffset(months=future_months), freq='MS')
+    lower_2, lower_1, y_pred_future, upper_1, upper_2 = fit.band_matrix(future_dates, multiples=(-2, -1, 0, 1, 2))
 
     fig = go.Figure()
 
@@ -219,4 +182,4 @@ def plot_regression(df, scale='linear', future_months=12):
         hovermode="x unified"
     )
 
-    return fig.to_html(full_html=False)
\ No newline at end of file
+    return fig.to_html(full_html=False, include_plotlyjs=False)
\ No newline at end of file
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, maxsize=128, ttl=900):
+        self.maxsize = maxsize
+        self.ttl = ttl  # in seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a cached value, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entries if the cache is full
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def portfolio_key(form_data):
+    """
+    Canonical hash of the portfolio parameters (tickers, allocations, amounts, frequency, dates, fee)
+    """
+    tickers = [str(ticker).upper() for ticker in form_data['tickers']]
+    allocations = {str(ticker).upper(): float(weight) for ticker, weight in form_data['allocations'].items()}
+
+    params = {
+        # Ticker order matters: contributions are invested in that order
+        'tickers': tickers,
+        'allocations': [allocations.get(ticker, 0.0) for ticker in tickers],
+        'initial_amount': float(form_data['initial_amount']),
+        'recurring_contribution': float(form_data['recurring_contribution']),
+        'frequency': form_data['frequency'],
+        'start_date': str(form_data['start_date'])[:10],
+        'end_date': str(form_data['end_date'])[:10],
+        'fee': float(form_data['fee'])
+    }
+
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
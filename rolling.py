@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from simulation import InvestmentSimulator
+
+
+def _strided_cumsum(values, stride):
+    """
+    Cumulative sums along the first axis of values[t] + values[t - stride] + values[t - 2 * stride] + ...
+    """
+    length = len(values)
+    padded = np.zeros((-(-length // stride) * stride,) + values.shape[1:])
+    padded[:length] = values
+    return padded.reshape((-1, stride) + values.shape[1:]).cumsum(axis=0).reshape(padded.shape)[:length]
+
+
+def rolling_windows(dates, prices, weights, months, initial_amount, recurring_contribution, months_between,
+                    service_fee=0.0, expense_ratios=None):
+    """
+    Compute the terminal value, CAGR and volatility of every window of a number of months
+    prices is the (dates x tickers) array of month-start prices, weights the proportions of the tickers.
+
+    In every window, the initial amount is invested at the start and the recurring contribution
+    every months_between months after it, split by the weights and held until the end.
+    Windows are frictionless (fractional units, no cash reserve), and the fees are applied to
+    the final value like in the simulation. Only windows where every ETF has a price are computed.
+
+    All windows come from cumulative sums over the shared prices, in O(dates x tickers)
+    Returns a dataframe indexed by the window start dates
+    """
+    dates = pd.DatetimeIndex(dates)
+    prices = np.asarray(prices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum()
+    if expense_ratios is None:
+        expense_ratios = np.zeros(len(weights))
+
+    starts = np.arange(len(dates) - months)
+    ends = starts + months
+
+    # Windows with a missing price are left out
+    missing = np.concatenate([[0], np.cumsum(np.isnan(prices).any(axis=1))])
+    complete = missing[ends + 1] - missing[starts] == 0
+    prices = np.where(np.isnan(prices), 1.0, prices)
+
+    # Units bought per unit of weight: initial amount at the start, contributions at
+    # start + k * months_between (k >= 1), a difference of cumulative sums of 1 / price
+    # with a stride of months_between
+    contribution_count = months // months_between
+    inverse_sums = _strided_cumsum(1 / prices, months_between)
+    units = (
+        initial_amount / prices[starts]
+        + recurring_contribution * (inverse_sums[starts + contribution_count * months_between] - inverse_sums[starts])
+    )
+
+    holding_prices = prices[ends] * (1 - np.asarray(expense_ratios, dtype=float) / 252)
+    final_values = (units * holding_prices) @ weights * (1 - service_fee / 100 / 12)
+    invested = initial_amount + recurring_contribution * contribution_count
+
+    # CAGR as in the metrics: (final value / invested) ^ (1 / years) - 1
+    years = (dates[ends] - dates[starts]).days.to_numpy() / 365.25
+    cagr = (final_values / invested) ** (1 / years) - 1
+
+    # Annual volatility of the monthly returns of the weighted ETFs,
+    # from the cumulative sums of returns and squared returns
+    returns = (prices[1:] / prices[:-1] - 1) @ weights
+    sums = np.concatenate([[0.0], np.cumsum(returns)])
+    square_sums = np.concatenate([[0.0], np.cumsum(returns ** 2)])
+    window_sums = sums[ends] - sums[starts]
+    variance = (square_sums[ends] - square_sums[starts] - window_sums ** 2 / months) / max(months - 1, 1)
+    volatility = np.sqrt(np.maximum(variance, 0)) * np.sqrt(12)
+
+    result = pd.DataFrame({
+        "End": dates[ends],
+        "Invested": invested,
+        "Final Value": final_values,
+        "CAGR": cagr,
+        "Volatility": volatility
+    }, index=pd.DatetimeIndex(dates[starts], name="Start"))
+
+    return result[complete]
+
+
+def rolling_backtest(portfolio, months):
+    """
+    Analyse every window of a number of months within the portfolio dates
+    (ex. all 10-year windows since 2005: start date in 2005 and months=120)
+    Prices are loaded once for the whole period, and no window is replayed month by month
+    """
+    simulator = InvestmentSimulator(portfolio)
+
+    return rolling_windows(
+        simulator.dates,
+        simulator._price_array(),
+        simulator.weights,
+        months,
+        portfolio.initial_amount,
+        portfolio.recurring_contribution,
+        simulator.months_between_contributions,
+        service_fee=portfolio.service_fee,
+        expense_ratios=simulator._expense_ratios()
+    )
@@ -1,15 +1,27 @@
 import pandas as pd
 import numpy as np
-import yfinance as yf
 from portfolio import Portfolio
+from market_data import load_monthly_prices, load_daily_prices
 from etf_search import get_etf_info
-import plotly.express as px
+from engine import simulate_prices, simulate_batch
 import plotly.graph_objects as go
 
+# Rebalancing strategies, as engine parameters:
+# (months between periodic rebalances, drift band of the threshold rebalance, contributions to the ETFs below target)
+REBALANCING = {
+    "Aucun": (0, 0.0, False),
+    "Mensuel": (1, 0.0, False),
+    "Trimestriel": (3, 0.0, False),
+    "Annuel": (12, 0.0, False),
+    "Seuil": (0, 0.05, False),
+    "Contributions": (0, 0.0, True)
+}
+
 
 class InvestmentSimulator:
-    def __init__(self, portfolio: Portfolio):
+    def __init__(self, portfolio: Portfolio, data=None, expense_ratios=None, rebalancing="Aucun"):
         self.portfolio = portfolio
+        self.rebalancing = rebalancing
 
         # Mapping of contribution frequency to number of months between contributions
         self.freq_map = {"Mensuel": 1, "Trimestriel": 3, "Semestriel": 6, "Annuel": 12}
@@ -22,7 +34,13 @@ class InvestmentSimulator:
         self.tickers = [etf.ticker for etf in portfolio.assets]
         self.weights = np.array([etf.weight for etf in portfolio.assets])
 
-        self.data = self._load_data()
+        # Monthly prices can be provided already loaded (ex. shared by a backtest runner)
+        if data is None:
+            self.data = self._load_data()
+        else:
+            self.data = data.reindex(self.dates, method='ffill')
+
+        self.expense_ratios = expense_ratios
 
 
 
@@ -33,200 +51,53 @@ class InvestmentSimulator:
         Ex. for may 2024, we have the closing price of april 30th, 2024.
         """
 
-        # Download daily price data from yfinance
-        # Starting one month earlier to get last month's close
-        data = yf.download(
-            self.tickers,
-            start=self.portfolio.start_date - pd.DateOffset(months=1), # starting one month earlier 
-            end=self.portfolio.end_date,
-            interval="1d",  # daily to get the last day of the month
-            auto_adjust=True)["Close"]
-
-        # If only one instance of ticker, dataframe structure instead of series
-        if isinstance(data, pd.Series):
-            data = data.to_frame()
-
-        # Get the last available price of each month
-        monthly_data = data.resample('ME').last()
-      
-        # Assign each price of the last day of the month to the 1st of the next month
-        monthly_data.index = monthly_data.index + pd.offsets.MonthBegin(1)
+        monthly_data = load_monthly_prices(self.tickers, self.portfolio.start_date, self.portfolio.end_date)
 
         # Align with expected simulation dates (already using 'M')
         return monthly_data.reindex(self.dates, method='ffill')
 
 
+    def _price_array(self):
+        """
+        Dense (months x tickers) price array, in the order of the portfolio assets
+        """
+        return self.data[self.tickers].to_numpy(dtype=float)
+
+
+    def _expense_ratios(self):
+        """
+        Get the ETF expense ratios, in the order of the portfolio assets
+        """
+        if self.expense_ratios is not None:
+            return self.expense_ratios
+        return [get_etf_info(ticker)['fees'] for ticker in self.tickers]
+
+
     def simulate(self):
         '''
         Simulate passive ETF investing
         '''
-        
-        # Get ETF expense ratios
-        etf_expense_ratios = {}
-        for ticker in self.tickers:
-            etf_info = get_etf_info(ticker)
-            etf_expense_ratios[ticker] = etf_info['fees']
-        
-        
-        
-        # Determine first valid date for each ETF
-        first_available_dates = {
-            ticker: date for ticker in self.tickers
-            if (date := self.data[ticker].first_valid_index()) is not None
-        }
-        
-        # Get available ETFs at a given date
-        def get_available_etfs(date):
-            available_etfs = []
-            for etf in self.portfolio.assets:
-                if (etf.ticker in first_available_dates and 
-                    first_available_dates[etf.ticker] <= date):
-                    available_etfs.append(etf)
-            return available_etfs
-        
-        # Calculate dynamic weights
-        def get_dynamic_weights(date):
-            available_etfs = get_available_etfs(date)
-            if not available_etfs:
-                return {}
-            
-            # Calculate total weight of available ETFs
-            total_available_weight = sum(etf.weight for etf in available_etfs)
-            
-            
-            dynamic_weights = {}
-            for etf in available_etfs:
-                dynamic_weights[etf.ticker] = etf.weight / total_available_weight
-                
-            return dynamic_weights
-        
-        # Initial investment
-        initial_date = self.dates[0]
-        available_etfs_initial = get_available_etfs(initial_date)
-        dynamic_weights_initial = get_dynamic_weights(initial_date)
-        
-        # print(f"Initial date: {initial_date}")
-        # print(f"Available ETFs: {[etf.ticker for etf in available_etfs_initial]}")
-        # print(f"Dynamic weights: {dynamic_weights_initial}")
-        
-        first_prices = self.data.loc[initial_date]
-        
-        # Initial investment (only in available ETFs)
-        for etf in available_etfs_initial:
-            ticker = etf.ticker
-            price = first_prices[ticker]
-            if np.isnan(price):
-                continue
-            
-            # Use dynamic weight instead of original weight
-            allocation_amount = self.portfolio.initial_amount * dynamic_weights_initial[ticker]
-            units = np.floor(allocation_amount / price)
-            amount_used = units * price
-            etf.units += units
-            self.portfolio.cash_reserve += allocation_amount - amount_used
-        
-        portfolio_values = []
-        monthly_fee_rate = self.portfolio.service_fee / 100 / 12
+        rebalance_every, rebalance_band, contribution_rebalance = REBALANCING[self.rebalancing]
+
+        portfolio_values, units, cash_reserve = simulate_prices(
+            self._price_array(),
+            self.weights,
+            initial_amount=self.portfolio.initial_amount,
+            recurring_contribution=self.portfolio.recurring_contribution,
+            months_between=self.months_between_contributions,
+            service_fee=self.portfolio.service_fee,
+            expense_ratios=self._expense_ratios(),
+            units=[etf.units for etf in self.portfolio.assets],
+            cash=self.portfolio.cash_reserve,
+            rebalance_every=rebalance_every,
+            rebalance_band=rebalance_band,
+            contribution_rebalance=contribution_rebalance
+        )
 
-        # Convert annual ETF expense ratios to daily rates ( ~252 trading days per year)
-        daily_etf_expense_rates = {
-            ticker: expense_ratio / 252 for ticker, expense_ratio in etf_expense_ratios.items()
-        }
-        
-        # Keep track of previous available ETFs to detect when new ones become available
-        prev_available_tickers = set(etf.ticker for etf in available_etfs_initial)
-        
-        # Simulation loop
-        for i, date in enumerate(self.dates):
-            current_prices = self.data.loc[date]
-            
-            # Check if new ETFs became available
-            current_available_etfs = get_available_etfs(date)
-            current_available_tickers = set(etf.ticker for etf in current_available_etfs)
-            
-            # If new ETFs became available, rebalance the portfolio
-            newly_available_tickers = current_available_tickers - prev_available_tickers
-            if newly_available_tickers:
-                print(f"Date {date}: New ETFs became available: {newly_available_tickers}")
-                
-                # Calculate current portfolio value
-                current_portfolio_value = sum(
-                    etf.units * current_prices[etf.ticker] 
-                    for etf in self.portfolio.assets 
-                    if etf.units > 0
-                )
-                total_value = current_portfolio_value + self.portfolio.cash_reserve
-                
-                # Sell all current holdings (prepare for reallocation)
-                for etf in self.portfolio.assets:
-                    if etf.units > 0:
-                        self.portfolio.cash_reserve += etf.units * current_prices[etf.ticker]
-                        etf.units = 0
-                
-                # Reinvest using new dynamic weights
-                dynamic_weights_current = get_dynamic_weights(date)
-                for etf in current_available_etfs:
-                    ticker = etf.ticker
-                    price = current_prices[ticker]
-                    if np.isnan(price):
-                        continue
-                    
-                    allocation_amount = total_value * dynamic_weights_current[ticker]
-                    units = np.floor(allocation_amount / price)
-                    amount_used = units * price
-                    etf.units += units
-                    self.portfolio.cash_reserve -= amount_used
-            
-            # Recurring contributions
-            if i % self.months_between_contributions == 0 and i > 0:
-                self.portfolio.cash_reserve += self.portfolio.recurring_contribution
-                
-                dynamic_weights_current = get_dynamic_weights(date)
-                for etf in current_available_etfs:
-                    ticker = etf.ticker
-                    allocation_amount = dynamic_weights_current[ticker] * self.portfolio.cash_reserve
-                    price = current_prices[ticker]
-                    if np.isnan(price):
-                        continue
-                        
-                    units_to_buy = np.floor(allocation_amount / price)
-                    amount_used = units_to_buy * price
-                    
-                    etf.units += units_to_buy
-                    self.portfolio.cash_reserve -= amount_used
-            
-            
-            portfolio_value = 0
-
-            # Apply daily ETF expense ratios to each holding individually
-            for etf in self.portfolio.assets:
-                if etf.units > 0:
-                    ticker = etf.ticker
-                    current_price = current_prices[ticker]
-                    if np.isnan(current_price):
-                        continue
-                    
-                    # Calculate value of this ETF holding
-                    etf_value = etf.units * current_price
-                    
-                    # Apply daily ETF expense ratio (reduces the effective value)
-                    if i > 0:  # Don't apply fees on the first day
-                        daily_fee_rate = daily_etf_expense_rates.get(ticker, 0)
-                        etf_value *= (1 - daily_fee_rate)
-                    
-                    portfolio_value += etf_value
-            
-            # Add cash reserve
-            portfolio_value += self.portfolio.cash_reserve
-            
-            # Apply service fee only after the first month
-            if i > 0:
-                portfolio_value *= (1 - monthly_fee_rate)
-            
-            portfolio_values.append(portfolio_value)
-            
-            # Update previous available tickers
-            prev_available_tickers = current_available_tickers
+        # Keep the final holdings on the portfolio
+        for etf, etf_units in zip(self.portfolio.assets, units):
+            etf.units = etf_units
+        self.portfolio.cash_reserve = cash_reserve
         
         # Create a dataframe with the portfolio values
         result_df = pd.DataFrame({
@@ -237,6 +108,106 @@ class InvestmentSimulator:
         return result_df
 
 
+    def simulate_daily(self, monthly=True):
+        '''
+        Simulate passive ETF investing on daily closes, the fees accruing every trading day
+        Contributions and periodic rebalances are made on the first trading day of their month.
+        Returns the portfolio value of each trading day, or if monthly is True, the value of the first
+        trading day of each month, indexed by month like simulate()
+        '''
+        rebalance_every, rebalance_band, contribution_rebalance = REBALANCING[self.rebalancing]
+
+        daily_data = load_daily_prices(self.tickers, self.portfolio.start_date, self.portfolio.end_date)
+        days = daily_data.index
+        first_month = self.dates[0]
+        row_months = ((days.year - first_month.year) * 12 + days.month - first_month.month).to_numpy()
+
+        portfolio_values, units, cash_reserve = simulate_prices(
+            daily_data[self.tickers].to_numpy(dtype=float),
+            self.weights,
+            initial_amount=self.portfolio.initial_amount,
+            recurring_contribution=self.portfolio.recurring_contribution,
+            months_between=self.months_between_contributions,
+            service_fee=self.portfolio.service_fee,
+            expense_ratios=self._expense_ratios(),
+            units=[etf.units for etf in self.portfolio.assets],
+            cash=self.portfolio.cash_reserve,
+            rebalance_every=rebalance_every,
+            rebalance_band=rebalance_band,
+            contribution_rebalance=contribution_rebalance,
+            row_months=row_months
+        )
+
+        # Keep the final holdings on the portfolio
+        for etf, etf_units in zip(self.portfolio.assets, units):
+            etf.units = etf_units
+        self.portfolio.cash_reserve = cash_reserve
+
+        result_df = pd.DataFrame({
+            "Date": days,
+            "Portfolio Value": portfolio_values
+        }).set_index("Date")
+
+        if monthly:
+            # Snapshot of the first trading day of each month
+            first_days = np.ones(len(row_months), dtype=bool)
+            first_days[1:] = row_months[1:] != row_months[:-1]
+            result_df = result_df[first_days]
+            result_df.index = result_df.index.to_period("M").to_timestamp().rename("Date")
+
+        return result_df
+
+
+    def simulate_batch(self, weights, initial_amounts=None, recurring_contributions=None,
+                       frequencies=None, service_fees=None, rebalancings=None):
+        '''
+        Simulate many variants of the portfolio on the already loaded prices
+        weights is a (N x tickers) matrix of proportions, in the order of the portfolio assets.
+        The other parameters default to the portfolio's, or give one value per scenario
+        (frequencies as "Mensuel", "Trimestriel", ..., rebalancings as keys of REBALANCING).
+        Returns the (N x months) matrix of portfolio values
+        '''
+        if initial_amounts is None:
+            initial_amounts = self.portfolio.initial_amount
+        if recurring_contributions is None:
+            recurring_contributions = self.portfolio.recurring_contribution
+        if frequencies is None:
+            months_between = self.months_between_contributions
+        else:
+            months_between = [self.freq_map[frequency] for frequency in frequencies]
+        if service_fees is None:
+            service_fees = self.portfolio.service_fee
+        if rebalancings is None:
+            rebalancings = [self.rebalancing]
+        rebalance_every, rebalance_bands, contribution_rebalance = zip(*[REBALANCING[name] for name in rebalancings])
+
+        values, _, _ = simulate_batch(
+            self._price_array(),
+            weights,
+            initial_amounts=initial_amounts,
+            recurring_contributions=recurring_contributions,
+            months_between=months_between,
+            service_fees=service_fees,
+            expense_ratios=self._expense_ratios(),
+            rebalance_every=rebalance_every,
+            rebalance_bands=rebalance_bands,
+            contribution_rebalance=contribution_rebalance
+        )
+        return values
+
+
+    def compare_rebalancing(self, strategies=None):
+        '''
+        Simulate the portfolio with several rebalancing strategies (all by default) in one batch
+        Returns a dataframe of the portfolio values, one column per strategy
+        '''
+        if strategies is None:
+            strategies = list(REBALANCING)
+
+        values = self.simulate_batch(np.tile(self.weights, (len(strategies), 1)), rebalancings=strategies)
+        return pd.DataFrame(values.T, index=pd.Index(self.dates, name="Date"), columns=strategies)
+
+
 def plot_portfolio(df, scale='linear', invested_amount=None):
     fig = go.Figure()
 
@@ -269,7 +240,7 @@ def plot_portfolio(df, scale='linear', invested_amount=None):
         hovermode="x unified",
     )
 
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 
@@ -324,7 +295,7 @@ def plot_annual_returns(df):
         hovermode="x unified"
     )
 
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 def interpret_annual_returns(df):
@@ -0,0 +1,53 @@
+import re
+import subprocess
+import sys
+
+# Import time budget of the Flask app module, in milliseconds (flask itself takes most of it)
+BUDGET_MS = 500
+
+# Modules loaded on first use only, never when a worker starts
+LAZY_MODULES = ["pandas", "numpy", "plotly", "yfinance", "sklearn"]
+
+
+def measure_import(module="app"):
+    """
+    Import a module in a fresh interpreter with -X importtime
+    Returns its cumulative import time (in ms) and the names of every imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True)
+
+    # Lines are: "import time: <self us> | <cumulative us> | <indented module name>"
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            timings.setdefault(match.group(4), int(match.group(2)))
+
+    return timings[module] / 1000, set(timings)
+
+
+def check_startup(module="app", budget_ms=BUDGET_MS):
+    """
+    Get the list of startup budget violations (empty if the import is fast enough)
+    """
+    import_ms, modules = measure_import(module)
+    print(f"import {module}: {import_ms:.0f} ms (budget {budget_ms} ms)")
+
+    errors = []
+    if import_ms > budget_ms:
+        errors.append(f"import {module} took {import_ms:.0f} ms, over the {budget_ms} ms budget")
+    for name in LAZY_MODULES:
+        if name in modules:
+            errors.append(f"import {module} loads {name}, which should be imported on first use")
+
+    return errors
+
+
+if __name__ == '__main__':
+    budget_ms = int(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    errors = check_startup(budget_ms=budget_ms)
+    for error in errors:
+        print(f"Error: {error}")
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+def day_offsets(dates, base_date):
+    """
+    Convert dates into numbers of days since base_date
+    """
+    return np.array([(d - base_date).days for d in dates], dtype=float)
+
+
+@dataclass
+class TrendFit:
+    """
+    Ordinary least squares fit of values (or log values) against day offsets
+    """
+    base_date: object
+    scale: str
+    slope: float
+    intercept: float
+    fitted: np.ndarray     # fitted values, in the fitted space (log values for the log scale)
+    residuals: np.ndarray
+    sigma: float           # standard deviation of the residuals
+    r2: float
+
+    def predict(self, dates):
+        """
+        Get the trend at any dates, in the fitted space
+        """
+        return self.intercept + self.slope * day_offsets(dates, self.base_date)
+
+    def band_matrix(self, dates, multiples=(-2, -1, 0, 1, 2)):
+        """
+        Get the trend shifted by multiples of sigma at any dates, in the original space
+        Returns a (len(multiples) x len(dates)) matrix
+        """
+        bands = self.predict(dates)[np.newaxis, :] + np.asarray(multiples, dtype=float)[:, np.newaxis] * self.sigma
+        return np.exp(bands) if self.scale == 'log' else bands
+
+
+def fit_trend(dates, values, scale='linear'):
+    """
+    Fit a linear trend over day offsets with the closed-form OLS solution
+    In log scale, the trend is fitted on the log of the values
+    """
+    base_date = dates[0]
+    x = day_offsets(dates, base_date)
+    y = np.log(values) if scale == 'log' else np.asarray(values, dtype=float)
+
+    x_mean = x.mean()
+    y_mean = y.mean()
+    x_centered = x - x_mean
+    slope = float(np.dot(x_centered, y - y_mean) / np.dot(x_centered, x_centered))
+    intercept = float(y_mean - slope * x_mean)
+
+    fitted = intercept + slope * x
+    residuals = y - fitted
+
+    # R² (1 for a perfect fit of constant values, like scikit-learn)
+    total_sum_squares = np.sum((y - y_mean) ** 2)
+    residual_sum_squares = np.sum(residuals ** 2)
+    if total_sum_squares > 0:
+        r2 = 1 - residual_sum_squares / total_sum_squares
+    else:
+        r2 = 1.0 if residual_sum_squares == 0 else 0.0
+
+    return TrendFit(
+        base_date=base_date,
+        scale=scale,
+        slope=slope,
+        intercept=intercept,
+        fitted=fitted,
+        residuals=residuals,
+        sigma=float(np.std(residuals)),
+        r2=float(r2)
+    )